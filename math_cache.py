@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from scipy.sparse import csr_matrix
+from math_satellites import ConnectivityView, generate_synthetic_satellite_grid
+from math_topology import SatelliteTopology, build_topology, connectivity_to_edges
+from math_direct import GroundedFactorization
+from math_superposition import solve_satellite_potentials
+from math_greedy import shortest_path_trees
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = os.environ.get(
+    "SATELLITE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "satellite_routing"))
+
+
+def params_key(kind, **params):
+    """Cache key for data produced by generator `kind` from JSON-serializable params."""
+    payload = json.dumps({"kind": kind, "version": CACHE_FORMAT_VERSION, "params": params},
+                         sort_keys=True, default=list)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def arrays_key(kind, *arrays):
+    """Cache key derived from array contents, for data without generator params."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{kind}:{CACHE_FORMAT_VERSION}".encode())
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+class ArrayCache:
+    """
+    Directory of cache entries, one per key, each holding named arrays as
+    .npy files plus meta.json.
+
+    Arrays are reopened with np.load(mmap_mode="r"), i.e. as read-only
+    np.memmap views, so several processes reading the same entry share one
+    page-cached copy. Entries are written to a temporary directory and
+    renamed into place, so readers never see a partial entry. Reads refresh
+    the entry's mtime, and put() evicts least-recently-used entries until
+    the cache fits in max_bytes.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=1 << 30):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """Returns ({name: memmap array}, meta) or None if the key is not cached."""
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, "meta.json")) as f:
+                meta = json.load(f)
+            arrays = {name: np.load(os.path.join(entry, f"{name}.npy"), mmap_mode="r")
+                      for name in meta["arrays"]}
+        except FileNotFoundError:
+            return None
+        os.utime(entry)
+        return arrays, meta["meta"]
+
+    def put(self, key, arrays, meta=None):
+        """Store {name: array} under key, replacing any existing entry. Returns get(key)."""
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.asarray(array))
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({"arrays": list(arrays), "meta": meta or {}}, f)
+
+        entry = self._entry(key)
+        self.invalidate(key)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # Another process stored the same key first
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict(keep=key)
+        return self.get(key)
+
+    def get_or_build(self, key, build):
+        """Return the cached entry for key, running build() -> (arrays, meta) on a miss."""
+        cached = self.get(key)
+        if cached is None:
+            cached = self.put(key, *build())
+        return cached
+
+    def invalidate(self, key=None):
+        """Remove one entry, or every entry when key is None."""
+        keys = [key] if key is not None else self.keys()
+        for k in keys:
+            shutil.rmtree(self._entry(k), ignore_errors=True)
+
+    def keys(self):
+        return [name for name in os.listdir(self.root)
+                if not name.startswith(".") and os.path.isdir(self._entry(name))]
+
+    def entry_size(self, key):
+        entry = self._entry(key)
+        return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+    def size(self):
+        return sum(self.entry_size(key) for key in self.keys())
+
+    def evict(self, keep=None):
+        """Drop least-recently-used entries (never `keep`) until size() <= max_bytes."""
+        entries = sorted(((os.path.getmtime(self._entry(key)), key, self.entry_size(key)) for key in self.keys()))
+        total = sum(size for _, _, size in entries)
+        for _, key, size in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self.invalidate(key)
+            total -= size
+
+
+def _csr_arrays(prefix, matrix):
+    return {f"{prefix}_indptr": matrix.indptr, f"{prefix}_indices": matrix.indices, f"{prefix}_data": matrix.data}
+
+
+def _csr_from(arrays, prefix, num_nodes):
+    return csr_matrix((arrays[f"{prefix}_data"], arrays[f"{prefix}_indices"], arrays[f"{prefix}_indptr"]),
+                      shape=(num_nodes, num_nodes), copy=False)
+
+
+def cached_synthetic_grid(cache, num_satellites=100, lat_range=(30, 55), lon_range=(-140, 160)):
+    """
+    generate_synthetic_satellite_grid through the cache.
+    Returns:
+        satellite_positions (memmap [N, 2]), connectivity (ConnectivityView over memmaps), key
+    """
+    key = params_key("synthetic_grid", num_satellites=num_satellites, lat_range=lat_range, lon_range=lon_range)
+
+    def build():
+        positions, connectivity = generate_synthetic_satellite_grid(num_satellites, lat_range, lon_range)
+        return {"positions": positions, "indptr": connectivity.indptr, "indices": connectivity.indices}, {}
+
+    arrays, _ = cache.get_or_build(key, build)
+    return arrays["positions"], ConnectivityView(arrays["indptr"], arrays["indices"]), key
+
+
+def cached_topology(cache, satellite_positions, connectivity, key=None):
+    """
+    build_topology through the cache: edge arrays, CSR Laplacian, component
+    labels, edge latencies and the latency-weighted adjacency. key defaults
+    to a hash of the positions and CSR connectivity arrays; pass the key from
+    cached_synthetic_grid to skip hashing.
+    """
+    if key is None:
+        if hasattr(connectivity, "indptr"):
+            key = arrays_key("topology", satellite_positions, connectivity.indptr, connectivity.indices)
+        else:
+            edge_u, edge_v, _ = connectivity_to_edges(connectivity, len(satellite_positions))
+            key = arrays_key("topology", satellite_positions, edge_u, edge_v)
+    else:
+        key = params_key("topology", source=key)
+
+    def build():
+        topology = build_topology(satellite_positions, connectivity)
+        arrays = {"edge_u": topology.edge_u, "edge_v": topology.edge_v, "labels": topology.labels,
+                  "edge_weights": topology.edge_weights()}
+        arrays.update(_csr_arrays("laplacian", topology.laplacian))
+        arrays.update(_csr_arrays("latency", topology.weighted_adjacency()))
+        return arrays, {"num_nodes": topology.num_nodes}
+
+    arrays, meta = cache.get_or_build(key, build)
+    num_nodes = meta["num_nodes"]
+    return SatelliteTopology.from_arrays(
+        arrays["edge_u"], arrays["edge_v"], num_nodes,
+        laplacian=_csr_from(arrays, "laplacian", num_nodes),
+        labels=arrays["labels"],
+        satellite_positions=satellite_positions,
+        edge_weights=arrays["edge_weights"],
+        weighted_adjacency=_csr_from(arrays, "latency", num_nodes),
+    ), key
+
+
+def cached_potential_table(cache, topology, key):
+    """
+    Unit-injection potential of every satellite, shape [N, N] (column s is
+    satellite s; see solve_satellite_potentials). This is the persisted form
+    of the grounded factorization: a SuperLU object cannot be serialized,
+    but every pair potential is phi[:, s] - phi[:, t].
+    """
+    def build():
+        A, idx_map, nodes = topology.system_matrix()
+        potentials, _ = solve_satellite_potentials(GroundedFactorization(A), idx_map, nodes)
+        return {"potentials": potentials}, {}
+
+    arrays, _ = cache.get_or_build(params_key("potential_table", source=key), build)
+    return arrays["potentials"]
+
+
+def cached_shortest_paths(cache, topology, key):
+    """All-pairs Dijkstra latencies and predecessors, shape [N, N] each."""
+    def build():
+        distances, predecessors, _ = shortest_path_trees(topology, range(topology.num_nodes), dense_fraction=0.0)
+        return {"distances": distances, "predecessors": predecessors.astype(np.int32)}, {}
+
+    arrays, _ = cache.get_or_build(params_key("shortest_paths", source=key), build)
+    return arrays["distances"], arrays["predecessors"]
+
+
+if __name__ == "__main__":
+    import time
+
+    cache = ArrayCache(os.path.join(tempfile.gettempdir(), "satellite_cache_demo"), max_bytes=256 << 20)
+    cache.invalidate()
+
+    for attempt in ("cold", "warm"):
+        start = time.perf_counter()
+        positions, connectivity, grid_key = cached_synthetic_grid(cache, 2500)
+        topology, topology_key = cached_topology(cache, positions, connectivity, key=grid_key)
+        potentials = cached_potential_table(cache, topology, topology_key)
+        distances, _ = cached_shortest_paths(cache, topology, topology_key)
+        elapsed = time.perf_counter() - start
+        print(f"{attempt} start: {elapsed * 1e3:.1f} ms, cache size {cache.size() / 1e6:.1f} MB")
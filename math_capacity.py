@@ -0,0 +1,167 @@
+import numpy as np
+from itertools import combinations
+from scipy.sparse.csgraph import dijkstra
+from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology
+from math_greedy import SATELLITE_CAPACITY, reconstruct_path, shortest_path_trees
+from math_network_setup import (
+    generate_sessions,
+    assign_users_to_closest_satellites,
+    print_user_satellite_pairs,
+)
+
+
+def path_latency(W, path):
+    """Sum of link weights along a path of satellite ids."""
+    if len(path) < 2:
+        return 0.0
+    return float(W[path[:-1], path[1:]].sum())
+
+
+class CapacityRouter:
+    """
+    Admission-controlled router that enforces a per-satellite capacity.
+
+    Every admitted route consumes one unit on each satellite it visits. The
+    cost of entering satellite j is its link latency scaled by
+    (1 + congestion_weight * load[j] / capacity[j]), and satellites at
+    capacity cannot be entered at all. Loads and edge costs are updated in
+    place for the satellites on each admitted or released path only, so
+    routing many sessions never rebuilds the cost matrix.
+    """
+
+    def __init__(self, topology, capacity=SATELLITE_CAPACITY, congestion_weight=1.0):
+        self.topology = topology
+        self.base = topology.weighted_adjacency()
+        self.costs = self.base.copy()
+        self.capacity = np.broadcast_to(np.asarray(capacity, dtype=float), (topology.num_nodes,)).copy()
+        self.load = np.zeros(topology.num_nodes, dtype=np.int64)
+        self.congestion_weight = congestion_weight
+
+        # CSR data positions of the edges entering each satellite
+        order = np.argsort(self.base.indices, kind="stable")
+        self._incoming_ptr = np.searchsorted(self.base.indices[order], np.arange(topology.num_nodes + 1))
+        self._incoming = order
+
+    def _refresh_costs(self, satellites):
+        for sat in np.unique(satellites):
+            positions = self._incoming[self._incoming_ptr[sat]:self._incoming_ptr[sat + 1]]
+            if self.load[sat] >= self.capacity[sat]:
+                self.costs.data[positions] = np.inf
+            else:
+                scale = 1 + self.congestion_weight * self.load[sat] / self.capacity[sat]
+                self.costs.data[positions] = self.base.data[positions] * scale
+
+    def saturated(self, sat_id):
+        return self.load[sat_id] >= self.capacity[sat_id]
+
+    def route(self, sat1, sat2):
+        """
+        Admit one route from sat1 to sat2 if capacity allows.
+        Returns:
+            path (list of sat ids) and its uncongested latency, or (None, inf)
+        """
+        if self.saturated(sat1) or self.saturated(sat2) or not self.topology.connected(sat1, sat2):
+            return None, float("inf")
+
+        if sat1 == sat2:
+            path = [sat1]
+        else:
+            distances, predecessors = dijkstra(self.costs, directed=True, indices=sat1,
+                                               return_predecessors=True)
+            if not np.isfinite(distances[sat2]):
+                return None, float("inf")
+            path = reconstruct_path(predecessors, sat1, sat2)
+
+        self.load[path] += 1
+        self._refresh_costs(path)
+        return path, path_latency(self.base, path)
+
+    def release(self, path):
+        """Return the capacity held by a previously admitted path."""
+        self.load[path] -= 1
+        self._refresh_costs(path)
+
+    def utilization(self):
+        return self.load / self.capacity
+
+
+def route_session_with_capacity(users, user_to_satellite, router):
+    """
+    Admit as many user pairs of one session as capacity allows. Pairs are
+    offered shortest-uncongested-latency first, which admits more of them
+    than arbitrary order.
+    Returns:
+        results: {(uid1, uid2): {"latency", "path", "admitted"}}
+        rejected: list of (uid1, uid2)
+    """
+    sources = {user_to_satellite[user.get_id()] for user in users}
+    distances, _, row_map = shortest_path_trees(router.topology, sources)
+
+    pairs = []
+    for user1, user2 in combinations(users, 2):
+        uid1, uid2 = user1.get_id(), user2.get_id()
+        sat1, sat2 = user_to_satellite[uid1], user_to_satellite[uid2]
+        pairs.append((distances[row_map[sat1], sat2], uid1, uid2, sat1, sat2))
+    pairs.sort(key=lambda pair: pair[0])
+
+    results = {}
+    rejected = []
+    for _, uid1, uid2, sat1, sat2 in pairs:
+        path, latency = router.route(sat1, sat2)
+        results[(uid1, uid2)] = {
+            "latency": latency,
+            "path": path,
+            "admitted": path is not None
+        }
+        if path is None:
+            rejected.append((uid1, uid2))
+    return results, rejected
+
+
+def route_sessions_with_capacity(sessions, user_to_satellite, satellite_positions, connectivity,
+                                 capacity=SATELLITE_CAPACITY, congestion_weight=1.0, topology=None):
+    """
+    Route many concurrent sessions against one shared load state.
+    Returns:
+        results: {session_id: {(uid1, uid2): route}}
+        rejected: {session_id: [(uid1, uid2)]}
+        router: CapacityRouter holding the final per-satellite loads
+    """
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    router = CapacityRouter(topology, capacity=capacity, congestion_weight=congestion_weight)
+
+    results, rejected = {}, {}
+    for session in sessions:
+        results[session.id], rejected[session.id] = route_session_with_capacity(
+            session.get_user(), user_to_satellite, router)
+    return results, rejected, router
+
+
+if __name__ == "__main__":
+    num_satellites = 100
+    num_sessions = 5
+    users_per_session = 20
+
+    satellite_positions, connectivity = generate_synthetic_satellite_grid(
+        num_satellites, lat_range=(30, 55), lon_range=(-140, 160))
+
+    sessions = generate_sessions(num_sessions, users_per_session)
+    users = [user for session in sessions for user in session.get_user()]
+    user_to_satellite_map = assign_users_to_closest_satellites(users, satellite_positions)
+    print_user_satellite_pairs(users, user_to_satellite_map)
+
+    print(f"\nCapacity-Aware Routing (capacity {SATELLITE_CAPACITY} per satellite):")
+    results, rejected, router = route_sessions_with_capacity(
+        sessions, user_to_satellite_map, satellite_positions, connectivity)
+
+    for session in sessions:
+        admitted = sum(1 for route in results[session.id].values() if route["admitted"])
+        print(f"Session {session.id}: admitted {admitted} pairs, rejected {len(rejected[session.id])}")
+
+    utilization = router.utilization()
+    busiest = np.argsort(utilization)[::-1][:10]
+    print("\nBusiest satellites:")
+    for sat in busiest:
+        print(f"S{sat}: load {router.load[sat]} / {router.capacity[sat]:.0f} ({utilization[sat]:.0%})")
@@ -1,97 +1,334 @@
+import argparse
+import csv
+import json
+import platform
+import sys
 import time
+import tracemalloc
+from functools import partial
 import numpy as np
-import matplotlib.pyplot as plt
-from math_satellites import generate_synthetic_satellite_grid, calculate_latency
-from math_network_setup import (
-    generate_sessions,
-    assign_users_to_closest_satellites,
-    print_user_satellite_pairs,
-    print_satellite_connectivity
-)
-from math_jacobi import compute_satellite_routes_jacobi
-from math_gauss_seidel import compute_satellite_routes_gauss_seidel
+import scipy
+from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology, pair_rhs
+from math_flow_results import FlowResults
+from math_instrumentation import RoutingProfiler
+from math_streaming import PAIR_SOLVERS, iter_user_pairs
+from math_network_setup import generate_sessions, assign_users_to_closest_satellites
+from math_jacobi import compute_satellite_routes_jacobi_batched
+from math_multigrid import infer_grid_shape
 from math_greedy import compute_satellite_routes_dijkstra
+from math_superposition import compute_satellite_routes_superposition
 
-user_counts = [10, 30, 50, 70, 90, 150, 200]
-num_satellites = 100
-results_summary = []
+BENCHMARK_METHODS = {}
 
-# Step 1: Fixed satellite network
-satellite_positions, connectivity = generate_synthetic_satellite_grid(
-    num_satellites, lat_range=(30, 55), lon_range=(-140, 160)
-)
 
-for users_per_session in user_counts:
-    print(f"\n\n=== Running for {users_per_session} users ===")
+def register_benchmark(name, kind):
+    """
+    Register a benchmark method. The decorated function takes
+    (satellite_positions, connectivity) and returns (state, solve), where
+    everything done before returning is timed as setup and
+    solve(state, workload) -> (results, iterations or None) is timed as the
+    routing phase. kind is "flow" or "latency" and selects the quality metric.
+    """
+    def decorator(setup):
+        BENCHMARK_METHODS[name] = (kind, setup)
+        return setup
+    return decorator
 
-    # Step 2: Generate consistent user set
-    sessions = generate_sessions(1, users_per_session)
-    session = sessions[0]
-    users = session.get_user()
+
+def _pair_solver_benchmark(method):
+    def setup(satellite_positions, connectivity, **options):
+        topology = build_topology(satellite_positions, connectivity)
+        return (topology, PAIR_SOLVERS[method](topology, **options)), _solve_pairs
+    return setup
+
+
+def _solve_pairs(state, workload):
+    topology, solve = state
+    _, idx_map, nodes = topology.system_matrix()
+    results = FlowResults(nodes, idx_map, len(workload["pairs"]))
+    iterations = 0
+    for uid1, uid2, sat1, sat2 in workload["pairs"]:
+        if not topology.connected(sat1, sat2):
+            results.add((uid1, uid2), None)
+            continue
+        b = pair_rhs(len(nodes), sat1, sat2, idx_map)
+        x, stats = solve(b)
+        iterations += stats.iterations
+        results.add((uid1, uid2), x)
+    return results, iterations
+
+
+for _method in ("jacobi", "gauss_seidel", "direct", "cg"):
+    register_benchmark(_method, "flow")(_pair_solver_benchmark(_method))
+register_benchmark("jacobi_mixed", "flow")(partial(_pair_solver_benchmark("jacobi"), precision="mixed"))
+register_benchmark("multigrid_algebraic", "flow")(_pair_solver_benchmark("multigrid"))
+
+
+@register_benchmark("multigrid", "flow")
+def _multigrid_benchmark(satellite_positions, connectivity):
+    """Geometric coarsening on the generator's orbit x slot grid (algebraic when it is incomplete)."""
+    grid_shape = infer_grid_shape(satellite_positions, connectivity)
+    return _pair_solver_benchmark("multigrid")(satellite_positions, connectivity, grid_shape=grid_shape)
+
+
+def _router_benchmark(router, prepare=None):
+    """
+    Benchmark a whole compute_satellite_routes_* router. Setup covers the
+    topology (plus `prepare`); method-specific setup inside the router is
+    timed as part of the solve.
+    """
+    def solve(topology, workload):
+        results = router(workload["users"], workload["user_to_satellite"], workload["satellite_positions"],
+                         workload["connectivity"], topology=topology)
+        return results, None
+
+    def setup(satellite_positions, connectivity):
+        topology = build_topology(satellite_positions, connectivity)
+        if prepare is not None:
+            prepare(topology)
+        return topology, solve
+    return setup
+
+
+register_benchmark("jacobi_batched", "flow")(_router_benchmark(compute_satellite_routes_jacobi_batched))
+register_benchmark("jacobi_batched_mixed", "flow")(_router_benchmark(
+    partial(compute_satellite_routes_jacobi_batched, precision="mixed")))
+register_benchmark("superposition", "flow")(_router_benchmark(compute_satellite_routes_superposition))
+register_benchmark("dijkstra", "latency")(_router_benchmark(
+    compute_satellite_routes_dijkstra, prepare=lambda topology: topology.weighted_adjacency()))
+
+
+def build_workload(num_satellites, num_users, seed):
+    """Deterministic constellation, users and user pairs for one benchmark case."""
+    satellite_positions, connectivity = generate_synthetic_satellite_grid(
+        num_satellites, lat_range=(30, 55), lon_range=(-140, 160))
+    users = generate_sessions(1, num_users, seed=seed)[0].get_user()
     user_to_satellite = assign_users_to_closest_satellites(users, satellite_positions)
+    return {
+        "satellite_positions": satellite_positions,
+        "connectivity": connectivity,
+        "users": users,
+        "user_to_satellite": user_to_satellite,
+        "pairs": list(iter_user_pairs(users, user_to_satellite)),
+    }
+
+
+def reference_total_flows(workload):
+    """Exact total_flow per (uid1, uid2) user pair, from the direct solver."""
+    state, solve = BENCHMARK_METHODS["direct"][1](workload["satellite_positions"], workload["connectivity"])
+    results, _ = solve(state, workload)
+    return {key: route["total_flow"] for key, route in results.items()}
+
+
+def quality_metrics(kind, results, workload, reference):
+    """
+    Flow methods report mean total_flow over reachable pairs and the worst
+    relative total_flow error against the direct solution (same-satellite
+    pairs have zero flow and no relative error); Dijkstra reports mean path
+    latency. The two metrics measure different things and are never
+    compared.
+    """
+    if kind == "latency":
+        latencies = [route["latency"] for route in results.values() if np.isfinite(route["latency"])]
+        return {"metric": "latency", "metric_mean": float(np.mean(latencies)) if latencies else float("inf"),
+                "max_rel_error": None}
+
+    totals, errors = [], []
+    for uid1, uid2, sat1, sat2 in workload["pairs"]:
+        total = results[(uid1, uid2)]["total_flow"]
+        if not np.isfinite(total):
+            continue
+        totals.append(total)
+        exact = reference[(uid1, uid2)]
+        if sat1 != sat2:
+            errors.append(abs(total - exact) / exact)
+    return {"metric": "total_flow", "metric_mean": float(np.mean(totals)) if totals else float("inf"),
+            "max_rel_error": float(max(errors)) if errors else 0.0}
+
+
+def _summary(samples):
+    q25, median, q75 = np.percentile(samples, [25, 50, 75])
+    return float(median), float(q75 - q25), float(np.min(samples))
+
+
+def benchmark_case(method, workload, repeats=5, warmup=1, reference=None):
+    """
+    Time one method on one workload: warmup runs are discarded, then setup
+    and solve are timed separately over `repeats` runs. Peak traced memory
+    and solver convergence come from one extra run under tracemalloc and a
+    RoutingProfiler, so neither skews the timings.
+    """
+    kind, setup = BENCHMARK_METHODS[method]
+    positions, connectivity = workload["satellite_positions"], workload["connectivity"]
+    setup_times, solve_times = [], []
+    results, iterations = None, None
+
+    for run in range(warmup + repeats):
+        start = time.perf_counter()
+        state, solve = setup(positions, connectivity)
+        middle = time.perf_counter()
+        results, iterations = solve(state, workload)
+        end = time.perf_counter()
+        if run >= warmup:
+            setup_times.append(middle - start)
+            solve_times.append(end - middle)
+
+    tracemalloc.start()
+    with RoutingProfiler() as profiler:
+        state, solve = setup(positions, connectivity)
+        solve(state, workload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    solves = sum(summary["solves"] for summary in profiler.methods.values())
+    converged = sum(summary["converged"] for summary in profiler.methods.values())
+
+    num_pairs = len(workload["pairs"])
+    setup_median, setup_iqr, _ = _summary(setup_times)
+    solve_median, solve_iqr, solve_min = _summary(solve_times)
+    record = {
+        "method": method,
+        "num_satellites": len(positions),
+        "num_users": len(workload["users"]),
+        "num_pairs": num_pairs,
+        "repeats": repeats,
+        "warmup": warmup,
+        "setup_median_s": setup_median,
+        "setup_iqr_s": setup_iqr,
+        "solve_median_s": solve_median,
+        "solve_iqr_s": solve_iqr,
+        "solve_min_s": solve_min,
+        "pairs_per_s": num_pairs / solve_median if solve_median > 0 else float("inf"),
+        "peak_memory_mb": peak / 1e6,
+        "iterations": iterations,
+        "iterations_per_pair": iterations / num_pairs if iterations is not None and num_pairs else None,
+        "converged_fraction": converged / solves if solves else None,
+        "max_residual": max((summary["max_residual"] for summary in profiler.methods.values()), default=None),
+    }
+    record.update(quality_metrics(kind, results, workload, reference))
+    return record
+
+
+def run_benchmarks(satellite_counts, user_counts, methods, repeats=5, warmup=1, seed=0, log=print):
+    records = []
+    for num_satellites in satellite_counts:
+        for num_users in user_counts:
+            workload = build_workload(num_satellites, num_users, seed)
+            reference = reference_total_flows(workload)
+            for method in methods:
+                record = benchmark_case(method, workload, repeats=repeats, warmup=warmup, reference=reference)
+                record["seed"] = seed
+                records.append(record)
+                if log:
+                    log(f"{method:>20} sats={num_satellites:<5} users={num_users:<5} "
+                        f"setup={record['setup_median_s'] * 1e3:8.2f}ms solve={record['solve_median_s'] * 1e3:9.2f}ms "
+                        f"(IQR {record['solve_iqr_s'] * 1e3:.2f}ms) peak={record['peak_memory_mb']:.1f}MB")
+    return records
+
+
+def environment_info():
+    return {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+
+def write_json(records, path, config):
+    with open(path, "w") as f:
+        json.dump({"config": config, "environment": environment_info(), "results": records}, f, indent=2)
+
+
+def write_csv(records, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(records[0]))
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def find_regressions(records, baseline_records, threshold=0.2):
+    """
+    Cases whose median solve time exceeds the baseline's by more than
+    `threshold` (a fraction). Returns a list of (record, baseline_record).
+    """
+    def key(record):
+        return record["method"], record["num_satellites"], record["num_users"]
+
+    baseline = {key(record): record for record in baseline_records}
+    regressions = []
+    for record in records:
+        previous = baseline.get(key(record))
+        if previous and record["solve_median_s"] > previous["solve_median_s"] * (1 + threshold):
+            regressions.append((record, previous))
+    return regressions
+
+
+def plot_benchmarks(records, path):
+    """Save solve time and throughput vs user count to an image file, headless."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, (ax_time, ax_rate) = plt.subplots(1, 2, figsize=(12, 5))
+    for method in dict.fromkeys(record["method"] for record in records):
+        for num_satellites in sorted({record["num_satellites"] for record in records}):
+            series = sorted((r["num_users"], r["solve_median_s"], r["pairs_per_s"]) for r in records
+                            if r["method"] == method and r["num_satellites"] == num_satellites)
+            if not series:
+                continue
+            users, times, rates = zip(*series)
+            label = f"{method} ({num_satellites} sats)"
+            ax_time.plot(users, times, "o-", label=label)
+            ax_rate.plot(users, rates, "o-", label=label)
+
+    ax_time.set(xlabel="Number of Users", ylabel="Median Solve Time (s)", title="Solve Time vs User Count", yscale="log")
+    ax_rate.set(xlabel="Number of Users", ylabel="Pairs per Second", title="Throughput vs User Count", yscale="log")
+    for ax in (ax_time, ax_rate):
+        ax.grid(True)
+    ax_time.legend(fontsize="small")
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark satellite routing methods.")
+    parser.add_argument("--satellites", type=int, nargs="+", default=[100])
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 30, 50])
+    parser.add_argument("--methods", nargs="+", default=list(BENCHMARK_METHODS), choices=list(BENCHMARK_METHODS))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results and environment as JSON")
+    parser.add_argument("--csv", help="write results as CSV")
+    parser.add_argument("--plot", help="save a solve-time plot to this image file")
+    parser.add_argument("--baseline", help="JSON from an earlier run to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed fractional slowdown of median solve time vs the baseline")
+    args = parser.parse_args(argv)
+
+    records = run_benchmarks(args.satellites, args.users, args.methods, repeats=args.repeats,
+                             warmup=args.warmup, seed=args.seed)
+    config = {key: value for key, value in vars(args).items() if key not in ("json", "csv", "plot", "baseline")}
+    if args.json:
+        write_json(records, args.json, config)
+    if args.csv:
+        write_csv(records, args.csv)
+    if args.plot:
+        plot_benchmarks(records, args.plot)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(records, json.load(f)["results"], args.threshold)
+        for record, previous in regressions:
+            print(f"REGRESSION {record['method']} sats={record['num_satellites']} users={record['num_users']}: "
+                  f"{previous['solve_median_s'] * 1e3:.2f}ms -> {record['solve_median_s'] * 1e3:.2f}ms")
+        if regressions:
+            return 1
+    return 0
+
 
-    # Step 3: Time and run Jacobi
-    start_jacobi = time.perf_counter()
-    res_jacobi = compute_satellite_routes_jacobi(users, user_to_satellite, satellite_positions, connectivity)
-    end_jacobi = time.perf_counter()
-    time_jacobi = end_jacobi - start_jacobi
-    latencies_jacobi = [d['total_flow'] for d in res_jacobi.values() if d['flow']]
-
-    # Step 4: Time and run Gauss-Seidel
-    start_gs = time.perf_counter()
-    res_gs = compute_satellite_routes_gauss_seidel(users, user_to_satellite, satellite_positions, connectivity)
-    end_gs = time.perf_counter()
-    time_gs = end_gs - start_gs
-    latencies_gs = [d['total_flow'] for d in res_gs.values() if d['flow']]
-
-    # Step 5: Time and run Dijkstra
-    start_dij = time.perf_counter()
-    res_dij = compute_satellite_routes_dijkstra(users, user_to_satellite, satellite_positions, connectivity)
-    end_dij = time.perf_counter()
-    time_dij = end_dij - start_dij
-    latencies_dij = [d['latency'] for d in res_dij.values() if d['path']]
-
-    results_summary.append({
-        'users': users_per_session,
-        'time_jacobi': time_jacobi,
-        'time_gauss': time_gs,
-        'time_dijkstra': time_dij,
-        'avg_latency_jacobi': np.mean(latencies_jacobi) if latencies_jacobi else float('inf'),
-        'avg_latency_gauss': np.mean(latencies_gs) if latencies_gs else float('inf'),
-        'avg_latency_dijkstra': np.mean(latencies_dij) if latencies_dij else float('inf')
-    })
-
-# Plotting results
-user_sizes = [r['users'] for r in results_summary]
-time_jacobi = [r['time_jacobi'] for r in results_summary]
-time_gauss = [r['time_gauss'] for r in results_summary]
-time_dijkstra = [r['time_dijkstra'] for r in results_summary]
-
-lat_jacobi = [r['avg_latency_jacobi'] for r in results_summary]
-lat_gauss = [r['avg_latency_gauss'] for r in results_summary]
-lat_dijkstra = [r['avg_latency_dijkstra'] for r in results_summary]
-
-plt.figure(figsize=(12, 5))
-
-plt.subplot(1, 2, 1)
-plt.plot(user_sizes, time_jacobi, 'o-', label='Jacobi')
-plt.plot(user_sizes, time_gauss, 's-', label='Gauss-Seidel')
-plt.plot(user_sizes, time_dijkstra, '^-', label='Dijkstra')
-plt.xlabel("Number of Users")
-plt.ylabel("Execution Time (s)")
-plt.title("Execution Time vs User Count")
-plt.legend()
-plt.grid(True)
-
-plt.subplot(1, 2, 2)
-plt.plot(user_sizes, lat_jacobi, 'o-', label='Jacobi')
-plt.plot(user_sizes, lat_gauss, 's-', label='Gauss-Seidel')
-plt.plot(user_sizes, lat_dijkstra, '^-', label='Dijkstra')
-plt.xlabel("Number of Users")
-plt.ylabel("Average Route Latency")
-plt.title("Latency vs User Count")
-plt.legend()
-plt.grid(True)
-
-plt.tight_layout()
-plt.show()
+if __name__ == "__main__":
+    sys.exit(main())
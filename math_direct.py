@@ -0,0 +1,119 @@
+import numpy as np
+from itertools import combinations
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import splu
+from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology, pair_rhs
+from math_flow_results import FlowResults
+from math_instrumentation import phase
+from math_network_setup import (
+    generate_sessions,
+    assign_users_to_closest_satellites,
+    plot_colored_user_satellite_graph,
+    print_user_satellite_pairs,
+    print_satellite_connectivity
+)
+
+
+class GroundedFactorization:
+    """
+    Sparse LU factorization of a graph Laplacian grounded at one node per
+    connected component.
+
+    The Laplacian is singular (constant vectors per component span its null
+    space). Pinning the potential of one node in every component to zero
+    removes that null space, so the remaining block can be factorized once
+    and reused for every right-hand side. Solutions are shifted to zero mean
+    per component so they do not depend on which node was grounded.
+    """
+
+    def __init__(self, A):
+        A = A.tocsr(copy=True)
+        A.eliminate_zeros()
+        self.N = A.shape[0]
+        self.num_components, self.labels = connected_components(A, directed=False)
+        self.ground = np.unique(self.labels, return_index=True)[1]
+
+        free_mask = np.ones(self.N, dtype=bool)
+        free_mask[self.ground] = False
+        self.free = np.flatnonzero(free_mask)
+
+        self.component_sizes = np.bincount(self.labels, minlength=self.num_components)
+        self.lu = None
+        if self.free.size:
+            A_free = A[self.free][:, self.free].tocsc()
+            self.lu = splu(A_free, permc_spec="MMD_AT_PLUS_A")
+
+    def connected(self, i, j):
+        return self.labels[i] == self.labels[j]
+
+    def solve(self, b):
+        """
+        Solve A x = b for a right-hand side that sums to zero on every component.
+        Args:
+            b: np.ndarray shape [N] or [N, K]
+        Returns:
+            x: np.ndarray with the same shape as b
+        """
+        x = np.zeros(b.shape)
+        if self.lu is not None:
+            x[self.free] = self.lu.solve(np.ascontiguousarray(b[self.free]))
+
+        component_sums = np.zeros((self.num_components,) + b.shape[1:])
+        np.add.at(component_sums, self.labels, x)
+        component_means = component_sums / self.component_sizes.reshape((-1,) + (1,) * (b.ndim - 1))
+        return x - component_means[self.labels]
+
+
+@phase("solve")
+def compute_satellite_routes_direct(users, user_to_satellite, satellite_positions, connectivity, topology=None,
+                                    flow_dtype=np.float64, flow_threshold=None):
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    A, idx_map, nodes = topology.system_matrix()
+    factorization = GroundedFactorization(A)
+    num_pairs = len(users) * (len(users) - 1) // 2
+    results = FlowResults(nodes, idx_map, num_pairs, dtype=flow_dtype, threshold=flow_threshold)
+
+    for user1, user2 in combinations(users, 2):
+        uid1, uid2 = user1.get_id(), user2.get_id()
+        sat1, sat2 = user_to_satellite[uid1], user_to_satellite[uid2]
+
+        if topology.connected(sat1, sat2):
+            b = pair_rhs(len(nodes), sat1, sat2, idx_map)
+            x = factorization.solve(b)
+            results.add((uid1, uid2), x)
+        else:
+            results.add((uid1, uid2), None)
+    return results
+
+
+if __name__ == "__main__":
+    num_satellites = 50
+    num_sessions = 1
+    users_per_session = 10
+
+    satellite_positions, connectivity = generate_synthetic_satellite_grid(
+        num_satellites, lat_range=(30, 55), lon_range=(-140, 160))
+
+    sessions = generate_sessions(num_sessions, users_per_session)
+    session = sessions[0]
+    users = session.get_user()
+
+    user_to_satellite_map = assign_users_to_closest_satellites(users, satellite_positions)
+    print_user_satellite_pairs(users, user_to_satellite_map)
+    print_satellite_connectivity(connectivity)
+
+    print("\nUser Pair Routing via Direct (Grounded LU) Method:")
+    results = compute_satellite_routes_direct(users, user_to_satellite_map, satellite_positions, connectivity)
+
+    for (u1, u2), data in results.items():
+        flow = data["flow"]
+        if flow is not None:
+            significant = {s: f for s, f in flow.items() if abs(f) > 0.01}
+            print(f"User {u1} <-> User {u2}: Flow Path = [" + ", ".join(
+                f"S{s}:{f:.2f}" for s, f in significant.items()) + "]")
+        else:
+            print(f"User {u1} <-> User {u2}: No valid flow path")
+
+    plot_colored_user_satellite_graph(session.get_user(), satellite_positions, user_to_satellite_map)
@@ -0,0 +1,255 @@
+import numpy as np
+from itertools import combinations
+from scipy.sparse import coo_matrix
+from math_satellites import generate_constellation
+from math_topology import connectivity_to_edges, edge_latencies, pair_rhs, to_float32_csr
+from math_reachability import ReachabilityIndex
+from math_jacobi import solve_potential_jacobi
+from math_gauss_seidel import multicolor_ordering, multicolor_sweeps, solve_potential_gauss_seidel
+from math_direct import GroundedFactorization
+from math_network_setup import generate_sessions, assign_users_to_closest_satellites
+
+
+def _fixed_pattern_csr(rows, cols, num_nodes):
+    """CSR matrix over (rows, cols) plus a map from each input entry to its data slot."""
+    order = np.arange(rows.size, dtype=float)
+    matrix = coo_matrix((order, (rows, cols)), shape=(num_nodes, num_nodes)).tocsr()
+    slots = np.empty(rows.size, dtype=np.int64)
+    slots[matrix.data.astype(np.int64)] = np.arange(rows.size)
+    return matrix, slots
+
+
+class DynamicConstellation:
+    """
+    Time-stepped multi-shell constellation with switching inter-plane links.
+
+    Satellites advance along their orbits every step. Intra-plane links are
+    permanent, and inter-plane links are switched off while either endpoint
+    is beyond polar_cutoff_deg latitude. The Laplacian and the latency
+    matrix keep the sparsity pattern of every candidate link, so a step only
+    rewrites the data entries of links that switched (plus all latencies,
+    which change with motion). topology_version increases only when the
+    active link set changes.
+
+    The object exposes the same interface as SatelliteTopology (nodes,
+    idx_map, labels, system_matrix(), connected(), weighted_adjacency(),
+    laplacian_float32()), so
+    every compute_satellite_routes_* function accepts it as topology=.
+    """
+
+    def __init__(self, shells, step_s=10.0, polar_cutoff_deg=70.0, lon_offset=-180.0):
+        self.shells = shells
+        self.step_s = step_s
+        self.polar_cutoff_deg = polar_cutoff_deg
+        self.lon_offset = lon_offset
+        self.time_s = 0.0
+        self.topology_version = 0
+
+        positions, connectivity, self.altitudes = generate_constellation(shells, lon_offset, 0.0)
+        self.satellite_positions = positions
+        self.num_nodes = len(positions)
+        self.nodes = list(range(self.num_nodes))
+        self.idx_map = {node: node for node in self.nodes}
+        self.edge_u, self.edge_v, _ = connectivity_to_edges(connectivity, self.num_nodes)
+
+        planes = np.concatenate([offset + np.arange(n * s) // s for offset, (n, s, _, _) in zip(
+            np.cumsum([0] + [n for n, _, _, _ in shells[:-1]]), shells)])
+        self.inter_plane = planes[self.edge_u] != planes[self.edge_v]
+
+        nodes = np.arange(self.num_nodes)
+        self.laplacian, slots = _fixed_pattern_csr(
+            np.concatenate([self.edge_u, self.edge_v, nodes]),
+            np.concatenate([self.edge_v, self.edge_u, nodes]), self.num_nodes)
+        num_edges = self.edge_u.size
+        self._uv_slots, self._vu_slots, self._diag_slots = np.split(slots, [num_edges, 2 * num_edges])
+        self._adjacency = self.laplacian.copy()
+        self._laplacian_float32 = None
+
+        self.active = self._active_links(positions)
+        self.reachability = ReachabilityIndex(self.num_nodes, self.edge_u[self.active], self.edge_v[self.active])
+        self._write_links()
+        self._write_latencies()
+
+    @property
+    def labels(self):
+        return self.reachability.labels
+
+    def _active_links(self, positions):
+        polar = np.abs(positions[:, 0]) > self.polar_cutoff_deg
+        return ~self.inter_plane | ~(polar[self.edge_u] | polar[self.edge_v])
+
+    def _write_links(self, changed=None):
+        if changed is None:
+            changed = np.arange(self.edge_u.size)
+        values = -self.active[changed].astype(float)
+        self.laplacian.data[self._uv_slots[changed]] = values
+        self.laplacian.data[self._vu_slots[changed]] = values
+
+        active_u, active_v = self.edge_u[self.active], self.edge_v[self.active]
+        degree = np.bincount(active_u, minlength=self.num_nodes) + np.bincount(active_v, minlength=self.num_nodes)
+        self.laplacian.data[self._diag_slots] = np.maximum(degree, 1)
+        self._laplacian_float32 = None
+
+    def _write_latencies(self):
+        latency = np.where(self.active, edge_latencies(self.satellite_positions, self.edge_u, self.edge_v), np.inf)
+        self._adjacency.data[self._uv_slots] = latency
+        self._adjacency.data[self._vu_slots] = latency
+        self._adjacency.data[self._diag_slots] = 0.0
+
+    def step(self):
+        """
+        Advance one time step.
+        Returns:
+            changed: np.ndarray of edge indices whose link state switched
+        """
+        self.time_s += self.step_s
+        self.satellite_positions, _, _ = generate_constellation(self.shells, self.lon_offset, self.time_s)
+
+        active = self._active_links(self.satellite_positions)
+        changed = np.flatnonzero(active != self.active)
+        self.active = active
+        if changed.size:
+            self.topology_version += 1
+            self._write_links(changed)
+            for e in changed:
+                u, v = int(self.edge_u[e]), int(self.edge_v[e])
+                if active[e]:
+                    self.reachability.add_link(u, v)
+                else:
+                    self.reachability.remove_link(u, v)
+        self._write_latencies()
+        return changed
+
+    def connected(self, sat1, sat2):
+        return self.reachability.connected(sat1, sat2)
+
+    def system_matrix(self):
+        return self.laplacian, self.idx_map, self.nodes
+
+    def weighted_adjacency(self):
+        return self._adjacency
+
+    def laplacian_float32(self):
+        if self._laplacian_float32 is None:
+            self._laplacian_float32 = to_float32_csr(self.laplacian)
+        return self._laplacian_float32
+
+
+class WarmStartSolver:
+    """
+    Per-pair potentials carried across time steps.
+
+    Iterative methods restart from the last potential solved for the same
+    (sat1, sat2) pair, so a user handed over to another satellite starts
+    cold. Cached matrix-dependent state (multicolour sweeps, the grounded
+    factorization) is rebuilt only when the constellation's topology_version
+    changes; positions alone never change the unweighted Laplacian. The
+    colouring covers every candidate link, so it stays valid whichever
+    links are switched on.
+    """
+
+    def __init__(self, constellation, method="gauss_seidel", warm_start=True, max_iter=1000, tol=1e-4):
+        self.constellation = constellation
+        self.method = method
+        self.warm_start = warm_start
+        self.max_iter = max_iter
+        self.tol = tol
+        self.potentials = {}
+        self._version = None
+        self._color_classes = None
+        if method == "gauss_seidel":
+            pattern = constellation.laplacian.copy()
+            pattern.data[:] = 1.0
+            self._color_classes = multicolor_ordering(pattern)
+        self._state = None
+        self.refactorizations = 0
+
+    def _refresh(self):
+        if self._version == self.constellation.topology_version:
+            return False
+        A = self.constellation.laplacian
+        self._version = self.constellation.topology_version
+        if self.method == "gauss_seidel":
+            self._state = multicolor_sweeps(A, self._color_classes)
+        elif self.method == "direct":
+            self._state = GroundedFactorization(A)
+        else:
+            return False
+        self.refactorizations += 1
+        return True
+
+    def solve(self, sat1, sat2):
+        """
+        Returns:
+            x: np.ndarray potential for the pair, iterations: int
+        """
+        self._refresh()
+        A = self.constellation.laplacian
+        b = pair_rhs(A.shape[0], sat1, sat2)
+        x0 = self.potentials.get((sat1, sat2)) if self.warm_start else None
+
+        if self.method == "direct":
+            x, iterations = self._state.solve(b), 0
+        elif self.method == "gauss_seidel":
+            x, stats = solve_potential_gauss_seidel(self._state, b, x0=x0, max_iter=self.max_iter, tol=self.tol)
+            iterations = stats.iterations
+        else:
+            x, stats = solve_potential_jacobi(A, b, x0=x0, max_iter=self.max_iter, tol=self.tol)
+            iterations = stats.iterations
+
+        self.potentials[sat1, sat2] = x
+        return x, iterations
+
+
+def simulate_dynamic_routing(constellation, users, num_steps, method="gauss_seidel", warm_start=True,
+                             max_iter=1000, tol=1e-4):
+    """
+    Advance the constellation num_steps times, re-assigning users and
+    re-solving every reachable user pair at each step.
+    Returns:
+        list of per-step dicts with time_s, links_switched, topology_version,
+        refactorized, pairs_solved and iterations
+    """
+    solver = WarmStartSolver(constellation, method=method, warm_start=warm_start, max_iter=max_iter, tol=tol)
+    history = []
+
+    for step in range(num_steps + 1):
+        changed = constellation.step() if step else np.zeros(0, dtype=np.int64)
+        refactorizations = solver.refactorizations
+        user_to_satellite = assign_users_to_closest_satellites(users, constellation.satellite_positions)
+
+        iterations = 0
+        pairs_solved = 0
+        for user1, user2 in combinations(users, 2):
+            uid1, uid2 = user1.get_id(), user2.get_id()
+            sat1, sat2 = user_to_satellite[uid1], user_to_satellite[uid2]
+            if sat1 == sat2 or not constellation.connected(sat1, sat2):
+                continue
+            _, pair_iterations = solver.solve(sat1, sat2)
+            iterations += pair_iterations
+            pairs_solved += 1
+
+        history.append({
+            "time_s": constellation.time_s,
+            "links_switched": int(changed.size),
+            "topology_version": constellation.topology_version,
+            "refactorized": solver.refactorizations > refactorizations,
+            "pairs_solved": pairs_solved,
+            "iterations": iterations
+        })
+    return history
+
+
+if __name__ == "__main__":
+    shells = [(12, 12, 550, 87)]
+    num_steps = 10
+    users = generate_sessions(1, 10)[0].get_user()
+
+    for warm_start in (False, True):
+        constellation = DynamicConstellation(shells, step_s=60.0)
+        history = simulate_dynamic_routing(constellation, users, num_steps, warm_start=warm_start)
+        print(f"\nGauss-Seidel, warm start = {warm_start}:")
+        for record in history:
+            print(f"t={record['time_s']:6.0f}s  switched={record['links_switched']:3d}  "
+                  f"pairs={record['pairs_solved']:3d}  iterations={record['iterations']:6d}  "
+                  f"refactorized={record['refactorized']}")
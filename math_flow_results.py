@@ -0,0 +1,157 @@
+import numpy as np
+from collections.abc import Mapping
+
+
+class FlowVector(Mapping):
+    """
+    Read-only {node: flow} view over one stored potential vector.
+    With a threshold, only nodes with |flow| above it are keys; use
+    .get(node, 0.0) for the rest. A FlowVector only exists for a solved
+    pair, so it is truthy even when no node passes the threshold.
+    """
+
+    def __init__(self, nodes, idx_map, values, positions=None):
+        self._nodes = nodes
+        self._idx_map = idx_map
+        self._values = values
+        self._positions = positions
+
+    def __getitem__(self, node):
+        i = self._idx_map[node]
+        if self._positions is None:
+            return float(self._values[i])
+        k = np.searchsorted(self._positions, i)
+        if k == self._positions.size or self._positions[k] != i:
+            raise KeyError(node)
+        return float(self._values[k])
+
+    def __iter__(self):
+        if self._positions is None:
+            return iter(self._nodes)
+        return (self._nodes[i] for i in self._positions.tolist())
+
+    def __len__(self):
+        return len(self._nodes) if self._positions is None else self._positions.size
+
+    def __bool__(self):
+        return True
+
+    def to_array(self):
+        """Dense potential vector in matrix index order."""
+        if self._positions is None:
+            return np.asarray(self._values)
+        x = np.zeros(len(self._nodes), dtype=self._values.dtype)
+        x[self._positions] = self._values
+        return x
+
+
+class FlowRoute(Mapping):
+    """Route record with the same keys as the eager {"flow", "total_flow"} dict."""
+
+    def __init__(self, results, slot):
+        self._results = results
+        self._slot = slot
+
+    def __getitem__(self, key):
+        if key == "flow":
+            return None if self._slot < 0 else self._results.flow_vector(self._slot)
+        if key == "total_flow":
+            return float("inf") if self._slot < 0 else float(self._results.total_flows[self._slot])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(("flow", "total_flow"))
+
+    def __len__(self):
+        return 2
+
+
+class FlowResults(Mapping):
+    """
+    Compact {(uid1, uid2): {"flow", "total_flow"}} results for potential-flow routers.
+
+    Each distinct solution is stored once, either as a row of one
+    preallocated [capacity, N] block or, when threshold is set, as a sparse
+    (positions, values) pair keeping only entries with |x| > threshold.
+    Several user pairs may share a slot (pairs on the same satellites).
+    total_flow is computed with NumPy when a solution is stored, and
+    results[(u1, u2)]["flow"] returns a lazy FlowVector view instead of a
+    dict over every satellite. Unreachable pairs map to slot -1.
+    """
+
+    def __init__(self, nodes, idx_map, capacity=0, dtype=np.float64, threshold=None):
+        self.nodes = nodes
+        self.idx_map = idx_map
+        self.dtype = np.dtype(dtype)
+        self.threshold = threshold
+        self.num_slots = 0
+        self.total_flows = np.zeros(capacity)
+        self.block = np.zeros((capacity, len(nodes)), dtype=self.dtype) if threshold is None else None
+        self._sparse = []
+        self._slots = {}
+
+    def _reserve(self, count):
+        needed = self.num_slots + count
+        if needed <= self.total_flows.size:
+            return
+        capacity = max(needed, 2 * self.total_flows.size)
+        self.total_flows = np.resize(self.total_flows, capacity)
+        if self.block is not None:
+            block = np.zeros((capacity, len(self.nodes)), dtype=self.dtype)
+            block[:self.num_slots] = self.block[:self.num_slots]
+            self.block = block
+
+    def store(self, x):
+        """Store one potential vector. Returns its slot."""
+        return int(self.store_block(np.asarray(x)[:, None])[0])
+
+    def store_block(self, X):
+        """Store the columns of X [N, K]. Returns their slots, shape [K]."""
+        count = X.shape[1]
+        self._reserve(count)
+        slots = np.arange(self.num_slots, self.num_slots + count)
+        self.total_flows[slots] = np.abs(X).sum(axis=0)
+        if self.block is None:
+            for column in X.T:
+                positions = np.flatnonzero(np.abs(column) > self.threshold).astype(np.int32)
+                self._sparse.append((positions, column[positions].astype(self.dtype)))
+        else:
+            self.block[slots] = X.T
+        self.num_slots += count
+        return slots
+
+    def assign(self, key, slot):
+        """Point a user-pair key at a stored slot (None or -1 for unreachable)."""
+        self._slots[key] = -1 if slot is None else int(slot)
+
+    def add(self, key, x):
+        """Store x for one pair (x None means unreachable)."""
+        self.assign(key, None if x is None else self.store(x))
+
+    def flow_vector(self, slot):
+        if self.block is not None:
+            return FlowVector(self.nodes, self.idx_map, self.block[slot])
+        positions, values = self._sparse[slot]
+        return FlowVector(self.nodes, self.idx_map, values, positions)
+
+    def total_flow_array(self):
+        """total_flow of every pair in key order; inf where unreachable."""
+        slots = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+        totals = np.full(slots.size, np.inf)
+        reachable = slots >= 0
+        totals[reachable] = self.total_flows[slots[reachable]]
+        return totals
+
+    def nbytes(self):
+        if self.block is not None:
+            return self.block[:self.num_slots].nbytes + self.total_flows.nbytes
+        return sum(p.nbytes + v.nbytes for p, v in self._sparse) + self.total_flows.nbytes
+
+    def __getitem__(self, key):
+        return FlowRoute(self, self._slots[key])
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self):
+        return len(self._slots)
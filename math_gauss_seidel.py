@@ -1,8 +1,13 @@
-import networkx as nx
+import time
 import numpy as np
 from itertools import combinations
-from scipy.sparse import lil_matrix, csr_matrix
+from scipy.sparse import diags
+from scipy.sparse.csgraph import connected_components, breadth_first_order
 from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology, pair_rhs
+from math_flow_results import FlowResults
+from math_instrumentation import phase, record_solve, relative_residual
+from math_route_cache import topology_token
 from math_network_setup import (
     generate_sessions,
     assign_users_to_closest_satellites,
@@ -12,33 +17,18 @@ from math_network_setup import (
 )
 
 
-def build_system_matrix(graph):
-    nodes = list(graph.nodes)
-    idx_map = {node: i for i, node in enumerate(nodes)}
-    N = len(nodes)
-
-    A = lil_matrix((N, N))
-    for node in nodes:
-        i = idx_map[node]
-        neighbors = list(graph.neighbors(node))
-        A[i, i] = len(neighbors)
-        for nbr in neighbors:
-            j = idx_map[nbr]
-            A[i, j] = -1
-
-    return csr_matrix(A), idx_map, nodes
-
-
 def solve_flow_gauss_seidel(A, idx_map, nodes, source, target, max_iter=100, tol=1e-4):
+    start = time.perf_counter()
     N = len(nodes)
-    b = np.zeros(N)
-    b[idx_map[source]] = 1
-    b[idx_map[target]] = -1
+    b = pair_rhs(N, source, target, idx_map)
 
     x = np.zeros(N)
     A = A.tocsr()
+    A_diag = A.diagonal()
 
-    for _ in range(max_iter):
+    iterations = 0
+    converged = False
+    for iterations in range(1, max_iter + 1):
         x_old = x.copy()
         for i in range(N):
             row_start = A.indptr[i]
@@ -51,39 +41,151 @@ def solve_flow_gauss_seidel(A, idx_map, nodes, source, target, max_iter=100, tol
                 if j != i:
                     sigma += val * x[j]
 
-            x[i] = (b[i] - sigma) / A[i, i]
+            x[i] = (b[i] - sigma) / A_diag[i]
 
         if np.linalg.norm(x - x_old, ord=np.inf) < tol:
+            converged = True
             break
 
+    record_solve("gauss_seidel_lexicographic", iterations, relative_residual(b - A @ x, b), converged, start)
     return {node: x[idx_map[node]] for node in nodes}
 
 
-def compute_satellite_routes_gauss_seidel(users, user_to_satellite, satellite_positions, connectivity):
-    results = {}
-    satellite_graph = nx.Graph()
-    for u in connectivity:
-        for v in connectivity[u]:
-            satellite_graph.add_edge(u, v)
+def multicolor_ordering(A):
+    """
+    Partition the nodes of A into colour classes with no edges inside a class.
+    A two-colouring from BFS depth parity is tried first (the orbit x slot grid
+    is bipartite when both dimensions are even); otherwise greedy colouring.
+    Returns:
+        list of np.ndarray, node indices of each colour class
+    """
+    A = A.tocsr()
+    N = A.shape[0]
+    off_diag = (A - diags(A.diagonal())).tocsr()
+    off_diag.eliminate_zeros()
+    rows, cols = off_diag.nonzero()
+
+    colors = np.zeros(N, dtype=int)
+    _, labels = connected_components(off_diag, directed=False)
+    for root in np.unique(labels, return_index=True)[1]:
+        order, predecessors = breadth_first_order(off_diag, root, directed=False)
+        for node in order[1:]:
+            colors[node] = 1 - colors[predecessors[node]]
+
+    if np.any(colors[rows] == colors[cols]):
+        colors = np.full(N, -1)
+        for i in range(N):
+            neighbor_colors = set(colors[off_diag.indices[off_diag.indptr[i]:off_diag.indptr[i + 1]]])
+            c = 0
+            while c in neighbor_colors:
+                c += 1
+            colors[i] = c
+
+    return [np.flatnonzero(colors == c) for c in range(colors.max() + 1)]
+
+
+def multicolor_sweeps(A, color_classes):
+    """Precompute (indices, off-diagonal rows, diagonal) for every colour class."""
+    A = A.tocsr()
+    A_diag = A.diagonal()
+    off_diag = (A - diags(A_diag)).tocsr()
+    return [(idx, off_diag[idx], A_diag[idx]) for idx in color_classes]
+
+
+def multicolor_sweep(sweeps, x, b, omega=1.0):
+    """One in-place Gauss-Seidel/SOR sweep over all colour classes."""
+    for idx, rows, d_c in sweeps:
+        x_gs = (b[idx] - rows @ x) / d_c
+        x[idx] = (1 - omega) * x[idx] + omega * x_gs
+    return x
+
+
+def sweep_residual(sweeps, x, b):
+    """b - A x assembled from the colour-class rows of the sweeps."""
+    r = np.empty_like(b)
+    for idx, rows, d_c in sweeps:
+        r[idx] = b[idx] - rows @ x - d_c * x[idx]
+    return r
+
+
+def solve_potential_gauss_seidel(sweeps, b, x0=None, omega=1.0, max_iter=100, tol=1e-4):
+    """
+    Multicolour Gauss-Seidel/SOR on precomputed sweeps, optionally warm-started.
+    Returns:
+        x: np.ndarray shape [N]
+        stats: SolveStats
+    """
+    start = time.perf_counter()
+    x = np.zeros(b.shape[0]) if x0 is None else np.array(x0, dtype=float)
+
+    iterations = 0
+    converged = False
+    for iterations in range(1, max_iter + 1):
+        x_old = x.copy()
+        multicolor_sweep(sweeps, x, b, omega)
+
+        if np.linalg.norm(x - x_old, ord=np.inf) < tol:
+            converged = True
+            break
+
+    return x, record_solve("gauss_seidel", iterations, relative_residual(sweep_residual(sweeps, x, b), b),
+                           converged, start)
+
+
+def solve_flow_gauss_seidel_multicolor(A, idx_map, nodes, source, target, color_classes=None,
+                                       omega=1.0, max_iter=100, tol=1e-4):
+    """
+    Gauss-Seidel (omega=1) or SOR (omega != 1) in multicolour order. Nodes of
+    one colour share no edges, so each colour class is updated in a single
+    vectorized step using the freshest values of the other classes.
+    """
+    N = len(nodes)
+    b = pair_rhs(N, source, target, idx_map)
+
+    if color_classes is None:
+        color_classes = multicolor_ordering(A)
+    sweeps = multicolor_sweeps(A, color_classes)
+
+    x, _ = solve_potential_gauss_seidel(sweeps, b, omega=omega, max_iter=max_iter, tol=tol)
+    return {node: x[idx_map[node]] for node in nodes}
+
 
-    A, idx_map, nodes = build_system_matrix(satellite_graph)
+@phase("solve")
+def compute_satellite_routes_gauss_seidel(users, user_to_satellite, satellite_positions, connectivity,
+                                          omega=1.0, topology=None, flow_dtype=np.float64, flow_threshold=None,
+                                          max_iter=100, tol=1e-4, cache=None):
+    """
+    Args:
+        cache: optional RouteCache; pairs already solved on the same topology
+            with the same omega/max_iter/tol (in either direction) are not
+            re-solved, and the colour sweeps are only built on a miss
+    """
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    A, idx_map, nodes = topology.system_matrix()
+    num_pairs = len(users) * (len(users) - 1) // 2
+    results = FlowResults(nodes, idx_map, num_pairs, dtype=flow_dtype, threshold=flow_threshold)
+    token = topology_token(topology) if cache is not None else None
+    sweeps = []
+
+    def solve(sat1, sat2):
+        if not sweeps:
+            sweeps.extend(multicolor_sweeps(A, multicolor_ordering(A)))
+        b = pair_rhs(len(nodes), sat1, sat2, idx_map)
+        return solve_potential_gauss_seidel(sweeps, b, omega=omega, max_iter=max_iter, tol=tol)[0]
 
     for user1, user2 in combinations(users, 2):
         uid1, uid2 = user1.get_id(), user2.get_id()
         sat1, sat2 = user_to_satellite[uid1], user_to_satellite[uid2]
 
-        if nx.has_path(satellite_graph, sat1, sat2):
-            flow = solve_flow_gauss_seidel(A, idx_map, nodes, source=sat1, target=sat2)
-            total_flow = sum(abs(f) for f in flow.values())
-            results[(uid1, uid2)] = {
-                "flow": flow,
-                "total_flow": total_flow
-            }
+        if topology.connected(sat1, sat2):
+            if cache is None:
+                x = solve(sat1, sat2)
+            else:
+                x = cache.flow(token, "gauss_seidel", (omega, max_iter, tol), sat1, sat2, solve)
+            results.add((uid1, uid2), x)
         else:
-            results[(uid1, uid2)] = {
-                "flow": None,
-                "total_flow": float("inf")
-            }
+            results.add((uid1, uid2), None)
     return results
 
 
@@ -109,7 +211,7 @@ if __name__ == "__main__":
 
     for (u1, u2), data in results.items():
         flow = data["flow"]
-        if flow:
+        if flow is not None:
             significant = {s: f for s, f in flow.items() if abs(f) > 0.01}
             print(f"User {u1} <-> User {u2}: Flow Path = [" + ", ".join(
                 f"S{s}:{f:.2f}" for s, f in significant.items()) + "]")
@@ -1,7 +1,12 @@
 import networkx as nx
 import numpy as np
+from collections.abc import Mapping
 from itertools import combinations
-from math_satellites import generate_synthetic_satellite_grid, calculate_latency
+from scipy.sparse.csgraph import dijkstra
+from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology
+from math_instrumentation import phase
+from math_route_cache import topology_token
 from math_network_setup import (
     generate_sessions,
     assign_users_to_closest_satellites,
@@ -12,41 +17,143 @@ from math_network_setup import (
 
 SATELLITE_CAPACITY = 20
 
-def build_satellite_graph(satellite_positions, connectivity):
+def build_satellite_graph(satellite_positions, connectivity, topology=None):
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
     G = nx.Graph()
-    for u in connectivity:
-        for v in connectivity[u]:
-            if not G.has_edge(u, v):
-                lat1, lon1 = satellite_positions[u]
-                lat2, lon2 = satellite_positions[v]
-                latency = calculate_latency(lat1, lon1, lat2, lon2)
-                G.add_edge(u, v, weight=latency)
+    G.add_nodes_from(topology.nodes)
+    G.add_weighted_edges_from(zip(topology.edge_u.tolist(), topology.edge_v.tolist(),
+                                  topology.edge_weights().tolist()))
     return G
 
-def compute_satellite_routes_dijkstra(users, user_to_satellite, satellite_positions, connectivity):
+def reconstruct_path(predecessors, source, target):
+    """Walk a single-source predecessor array back from target to source."""
+    path = [target]
+    while path[-1] != source:
+        path.append(int(predecessors[path[-1]]))
+    return path[::-1]
+
+
+class LazyRoute(Mapping):
+    """
+    Route record with the same keys as the eager {"latency", "path"} dict.
+    The path is rebuilt from the shortest-path tree only when first read.
+    """
+
+    def __init__(self, latency, predecessors, source, target):
+        self._latency = latency
+        self._predecessors = predecessors
+        self._source = source
+        self._target = target
+        self._path = None
+
+    def __getitem__(self, key):
+        if key == "latency":
+            return self._latency
+        if key == "path":
+            if self._path is None:
+                self._path = reconstruct_path(self._predecessors, self._source, self._target)
+            return self._path
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(("latency", "path"))
+
+    def __len__(self):
+        return 2
+
+
+def shortest_path_trees(topology, sources, dense_fraction=0.5):
+    """
+    One single-source Dijkstra per distinct source on the CSR latency matrix,
+    or a single all-pairs run when the sources cover most of the constellation.
+    Returns:
+        distances, predecessors: np.ndarray shape [S, N] (or [N, N] when dense)
+        row_map: {source: row}
+    """
+    W = topology.weighted_adjacency()
+    sources = np.asarray(sorted(sources), dtype=np.int64)
+    if sources.size > dense_fraction * topology.num_nodes:
+        distances, predecessors = dijkstra(W, directed=False, return_predecessors=True)
+        return distances, predecessors, {s: s for s in range(topology.num_nodes)}
+
+    distances, predecessors = dijkstra(W, directed=False, indices=sources, return_predecessors=True)
+    return distances, predecessors, {s: row for row, s in enumerate(sources.tolist())}
+
+
+@phase("solve")
+def compute_satellite_routes_dijkstra(users, user_to_satellite, satellite_positions, connectivity, topology=None,
+                                     cache=None):
+    """
+    Args:
+        cache: optional RouteCache; shortest-path trees are only computed for
+            sources of pairs that are not cached yet (in either direction)
+    """
     results = {}
-    G = build_satellite_graph(satellite_positions, connectivity)
-    satellite_usage = {i: 0 for i in range(len(satellite_positions))}
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    if cache is not None:
+        return cached_dijkstra_routes(users, user_to_satellite, topology, cache)
+
+    sources = {user_to_satellite[user.get_id()] for user in users}
+    distances, predecessors, row_map = shortest_path_trees(topology, sources)
 
     for user1, user2 in combinations(users, 2):
         uid1, uid2 = user1.get_id(), user2.get_id()
         sat1, sat2 = user_to_satellite[uid1], user_to_satellite[uid2]
 
-        if nx.has_path(G, sat1, sat2):
-            path = nx.dijkstra_path(G, source=sat1, target=sat2, weight="weight")
-            latency = nx.dijkstra_path_length(G, sat1, sat2, weight="weight")
-            for s in path:
-                satellite_usage[s] += 1
+        row = row_map[sat1]
+        if topology.connected(sat1, sat2):
+            results[(uid1, uid2)] = LazyRoute(float(distances[row, sat2]), predecessors[row], sat1, sat2)
+        else:
             results[(uid1, uid2)] = {
-                "latency": latency,
-                "path": path
+                "latency": float('inf'),
+                "path": None
             }
+
+    return results
+
+
+def cached_dijkstra_routes(users, user_to_satellite, topology, cache):
+    """
+    compute_satellite_routes_dijkstra through a RouteCache. Pairs are solved
+    from their lower-numbered satellite, so where several paths tie on
+    latency the path may differ from the uncached router's.
+    """
+    token = topology_token(topology, weighted=True)
+    pairs = []
+    sources = set()
+    for user1, user2 in combinations(users, 2):
+        uid1, uid2 = user1.get_id(), user2.get_id()
+        sat1, sat2 = user_to_satellite[uid1], user_to_satellite[uid2]
+        pairs.append((uid1, uid2, sat1, sat2))
+        if topology.connected(sat1, sat2) and not cache.contains_route(token, "dijkstra", sat1, sat2):
+            sources.add(min(sat1, sat2))
+
+    # {source: (distances, predecessors)}; trees for sources that were cached at
+    # scan time but evicted before lookup are computed on demand
+    trees = {}
+    if sources:
+        distances, predecessors, row_map = shortest_path_trees(topology, sources)
+        trees = {s: (distances[row], predecessors[row]) for s, row in row_map.items()}
+
+    def solve(sat1, sat2):
+        if sat1 not in trees:
+            distances, predecessors, _ = shortest_path_trees(topology, [sat1], dense_fraction=1.0)
+            trees[sat1] = (distances[0], predecessors[0])
+        distances, predecessors = trees[sat1]
+        return float(distances[sat2]), reconstruct_path(predecessors, sat1, sat2)
+
+    results = {}
+    for uid1, uid2, sat1, sat2 in pairs:
+        if topology.connected(sat1, sat2):
+            latency, path = cache.route(token, "dijkstra", sat1, sat2, solve)
+            results[(uid1, uid2)] = {"latency": latency, "path": path}
         else:
             results[(uid1, uid2)] = {
                 "latency": float('inf'),
                 "path": None
             }
-
     return results
 
 if __name__ == "__main__":
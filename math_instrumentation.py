@@ -0,0 +1,144 @@
+import time
+import numpy as np
+from contextlib import contextmanager
+
+_hooks = []
+_phase_stack = []
+
+
+class SolveStats:
+    """
+    Outcome of one linear solve.
+
+    residual is the relative residual ||b - A x||_2 / ||b||_2 of the
+    returned x (absolute when b is zero). converged reports whether the
+    method's own stopping test was met before max_iter; for Jacobi and
+    Gauss-Seidel that test is on the step size, not on the residual.
+    """
+    __slots__ = ("method", "iterations", "residual", "converged", "wall_time_s")
+
+    def __init__(self, method, iterations, residual, converged, wall_time_s):
+        self.method = method
+        self.iterations = iterations
+        self.residual = residual
+        self.converged = converged
+        self.wall_time_s = wall_time_s
+
+    def __repr__(self):
+        return (f"SolveStats(method={self.method!r}, iterations={self.iterations}, residual={self.residual:.3g}, "
+                f"converged={self.converged}, wall_time_s={self.wall_time_s:.3g})")
+
+
+def relative_residual(r, b):
+    """||r||_2 / ||b||_2 per column, or ||r||_2 where b is zero."""
+    r_norm = np.linalg.norm(r, axis=0)
+    b_norm = np.linalg.norm(b, axis=0)
+    return np.where(b_norm > 0, r_norm / np.where(b_norm > 0, b_norm, 1.0), r_norm)
+
+
+def record_solve(method, iterations, residual, converged, start):
+    """Build SolveStats for a solve that began at perf_counter() == start and pass it to the hooks."""
+    stats = SolveStats(method, int(iterations), float(np.max(residual, initial=0.0)), bool(converged),
+                       time.perf_counter() - start)
+    for hook in _hooks:
+        hook.on_solve(stats)
+    return stats
+
+
+def add_hook(hook):
+    """
+    Register an object with on_solve(stats) and on_phase(name, seconds)
+    methods. With no hooks registered, instrumentation costs one list check.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+@contextmanager
+def phase(name):
+    """
+    Time a block (or, used as a decorator, a function call) as one
+    occurrence of a named phase, if any hook is listening. Time spent in
+    nested phases is reported under those phases only, so a router that
+    builds its own topology reports graph_build and matrix_assembly
+    separately from solve.
+    """
+    if not _hooks:
+        yield
+        return
+    _phase_stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = _phase_stack.pop()
+        if _phase_stack:
+            _phase_stack[-1] += elapsed
+        for hook in _hooks:
+            hook.on_phase(name, elapsed - nested)
+
+
+class RoutingProfiler:
+    """
+    Hook that aggregates SolveStats and phase timings over a routing run.
+
+    Phases reported by the library are "graph_build", "matrix_assembly",
+    "assignment" and "solve". Use as a context manager to register and
+    unregister it:
+
+        with RoutingProfiler() as profiler:
+            compute_satellite_routes_jacobi(...)
+        print(profiler.report())
+    """
+
+    def __init__(self, keep_solves=False):
+        self.keep_solves = keep_solves
+        self.solves = []
+        self.phases = {}
+        self.methods = {}
+
+    def on_solve(self, stats):
+        summary = self.methods.setdefault(stats.method, {
+            "solves": 0, "converged": 0, "iterations": 0, "max_iterations": 0,
+            "max_residual": 0.0, "wall_time_s": 0.0})
+        summary["solves"] += 1
+        summary["converged"] += stats.converged
+        summary["iterations"] += stats.iterations
+        summary["max_iterations"] = max(summary["max_iterations"], stats.iterations)
+        summary["max_residual"] = max(summary["max_residual"], stats.residual)
+        summary["wall_time_s"] += stats.wall_time_s
+        if self.keep_solves:
+            self.solves.append(stats)
+
+    def on_phase(self, name, seconds):
+        calls, total = self.phases.get(name, (0, 0.0))
+        self.phases[name] = (calls + 1, total + seconds)
+
+    def summary(self):
+        return {
+            "phases": {name: {"calls": calls, "seconds": total} for name, (calls, total) in self.phases.items()},
+            "solvers": {method: dict(summary, mean_iterations=summary["iterations"] / summary["solves"])
+                        for method, summary in self.methods.items()},
+        }
+
+    def report(self):
+        lines = [f"{'Phase':<26} {'calls':>6} {'seconds':>11}"]
+        for name, (calls, total) in self.phases.items():
+            lines.append(f"{name:<26} {calls:6d} {total:11.4f}")
+        lines.append(f"{'Solver':<26} {'solves':>6} {'converged':>10} {'mean iters':>11} {'max iters':>10} "
+                     f"{'max residual':>13} {'seconds':>8}")
+        for method, s in self.methods.items():
+            lines.append(f"{method:<26} {s['solves']:6d} {s['converged']:10d} {s['iterations'] / s['solves']:11.1f} "
+                         f"{s['max_iterations']:10d} {s['max_residual']:13.3g} {s['wall_time_s']:8.4f}")
+        return "\n".join(lines)
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_hook(self)
@@ -1,8 +1,11 @@
-import networkx as nx
+import time
 import numpy as np
 from itertools import combinations
-from scipy.sparse import lil_matrix, csr_matrix
 from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology, pair_rhs, pair_rhs_block, to_float32_csr
+from math_flow_results import FlowResults
+from math_instrumentation import phase, record_solve, relative_residual
+from math_route_cache import topology_token
 from math_network_setup import (
     generate_sessions,
     assign_users_to_closest_satellites,
@@ -11,66 +14,234 @@ from math_network_setup import (
     print_satellite_connectivity
 )
 
-def build_system_matrix(graph):
-    nodes = list(graph.nodes)
-    idx_map = {node: i for i, node in enumerate(nodes)}
-    N = len(nodes)
+PRECISIONS = ("float64", "mixed")
 
-    A = lil_matrix((N, N))
-    for node in nodes:
-        i = idx_map[node]
-        neighbors = list(graph.neighbors(node))
-        A[i, i] = len(neighbors)
-        for nbr in neighbors:
-            j = idx_map[nbr]
-            A[i, j] = -1
 
-    return csr_matrix(A), idx_map, nodes
+def check_precision(precision):
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {PRECISIONS}, got {precision!r}")
 
-def solve_flow_jacobi_sparse(A, idx_map, nodes, source, target, max_iter=100, tol=1e-4):
-    N = len(nodes)
-    b = np.zeros(N)
-    b[idx_map[source]] = 1
-    b[idx_map[target]] = -1
+def topology_float32(topology):
+    """
+    topology.laplacian_float32() when the topology caches one, otherwise a
+    fresh float32 copy of its system matrix.
+    """
+    if hasattr(topology, "laplacian_float32"):
+        return topology.laplacian_float32()
+    return to_float32_csr(topology.system_matrix()[0])
 
-    x = np.zeros(N)
+def solve_potential_jacobi(A, b, x0=None, max_iter=100, tol=1e-4):
+    """
+    Jacobi iteration on A x = b, optionally warm-started from x0.
+    Returns:
+        x: np.ndarray shape [N]
+        stats: SolveStats
+    """
+    start = time.perf_counter()
+    x = np.zeros(A.shape[0]) if x0 is None else np.array(x0, dtype=float)
     A_diag = A.diagonal()
     A_diag_inv = 1.0 / A_diag
 
-    for _ in range(max_iter):
+    iterations = 0
+    converged = False
+    for iterations in range(1, max_iter + 1):
         Ax = A @ x
         x_new = x + A_diag_inv * (b - Ax)
         if np.linalg.norm(x_new - x, ord=np.inf) < tol:
+            converged = True
             break
         x = x_new
 
+    return x, record_solve("jacobi", iterations, relative_residual(b - A @ x, b), converged, start)
+
+def solve_potential_jacobi_mixed(A, b, x0=None, max_iter=100, tol=1e-4, A32=None):
+    """
+    Jacobi with float32 sweeps and float64 iterative refinement.
+
+    Each refinement step forms the residual r = b - A x in float64, solves
+    A d = r with float32 Jacobi sweeps on A32 (a float32/int32 copy of A,
+    built when not given) and updates x += d in float64. It stops once the
+    float64 Jacobi step D^-1 (b - A x) is below tol, the same stopping rule
+    solve_potential_jacobi uses. Like plain Jacobi it can stall above tol
+    and stop at max_iter instead.
+    iterations counts float32 sweeps over all refinement steps.
+    Returns:
+        x: np.ndarray shape [N], float64
+        stats: SolveStats
+    """
+    start = time.perf_counter()
+    if A32 is None:
+        A32 = to_float32_csr(A)
+    x = np.zeros(A.shape[0]) if x0 is None else np.array(x0, dtype=float)
+    A_diag_inv = 1.0 / A.diagonal()
+    A_diag_inv32 = A_diag_inv.astype(np.float32)
+
+    iterations = 0
+    converged = False
+    while True:
+        r = b - A @ x
+        if np.linalg.norm(A_diag_inv * r, ord=np.inf) < tol:
+            converged = True
+            break
+        if iterations >= max_iter:
+            break
+        r32 = r.astype(np.float32)
+        d = np.zeros_like(r32)
+        while iterations < max_iter:
+            iterations += 1
+            d_new = d + A_diag_inv32 * (r32 - A32 @ d)
+            step = np.linalg.norm(d_new - d, ord=np.inf)
+            d = d_new
+            if step < tol:
+                break
+        x += d
+
+    return x, record_solve("jacobi_mixed", iterations, relative_residual(r, b), converged, start)
+
+def solve_flow_jacobi_sparse(A, idx_map, nodes, source, target, max_iter=100, tol=1e-4):
+    b = pair_rhs(len(nodes), source, target, idx_map)
+
+    x, _ = solve_potential_jacobi(A, b, max_iter=max_iter, tol=tol)
     return {node: x[idx_map[node]] for node in nodes}
 
-def compute_satellite_routes_jacobi(users, user_to_satellite, satellite_positions, connectivity):
-    results = {}
-    satellite_graph = nx.Graph()
-    for u in connectivity:
-        for v in connectivity[u]:
-            satellite_graph.add_edge(u, v)
+def solve_flow_jacobi_batched(A, B, max_iter=100, tol=1e-4):
+    """
+    Run Jacobi on a block of right-hand sides at once.
+    Args:
+        A: csr_matrix shape [N, N]
+        B: np.ndarray shape [N, P], one column per (source, target) pair
+    Returns:
+        X: np.ndarray shape [N, P]
+        stats: SolveStats over the whole block (iterations of the slowest
+            column, worst column residual, converged only if every column did)
+    Each column stops updating once its own step falls below tol, and
+    converged columns are dropped from the working block.
+    """
+    start = time.perf_counter()
+    X = np.zeros(B.shape)
+    A_diag_inv = (1.0 / A.diagonal())[:, None]
+    active = np.arange(B.shape[1])
+
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        X_active = X[:, active]
+        X_new = X_active + A_diag_inv * (B[:, active] - A @ X_active)
+        X[:, active] = X_new
+        step = np.abs(X_new - X_active).max(axis=0)
+        active = active[step >= tol]
+        if active.size == 0:
+            break
+
+    residual = relative_residual(B - A @ X, B)
+    return X, record_solve("jacobi_batched", iterations, residual, active.size == 0, start)
 
-    A, idx_map, nodes = build_system_matrix(satellite_graph)
+def solve_flow_jacobi_batched_mixed(A, B, max_iter=100, tol=1e-4, A32=None):
+    """
+    solve_flow_jacobi_batched with float32 sweeps and float64 iterative
+    refinement, column by column as in solve_potential_jacobi_mixed. The
+    working blocks of the sweeps are float32; only X and the residual
+    are float64.
+    Returns:
+        X: np.ndarray shape [N, P], float64
+        stats: SolveStats over the whole block
+    """
+    start = time.perf_counter()
+    if A32 is None:
+        A32 = to_float32_csr(A)
+    X = np.zeros(B.shape)
+    A_diag_inv = (1.0 / A.diagonal())[:, None]
+    A_diag_inv32 = A_diag_inv.astype(np.float32)
+
+    iterations = 0
+    while True:
+        R = B - A @ X
+        unresolved = np.flatnonzero(np.abs(A_diag_inv * R).max(axis=0, initial=0.0) >= tol)
+        if unresolved.size == 0 or iterations >= max_iter:
+            break
+        R32 = R[:, unresolved].astype(np.float32)
+        D = np.zeros_like(R32)
+        active = np.arange(unresolved.size)
+        while active.size and iterations < max_iter:
+            iterations += 1
+            D_active = D[:, active]
+            D_new = D_active + A_diag_inv32 * (R32[:, active] - A32 @ D_active)
+            D[:, active] = D_new
+            step = np.abs(D_new - D_active).max(axis=0)
+            active = active[step >= tol]
+        X[:, unresolved] += D
+
+    return X, record_solve("jacobi_batched_mixed", iterations, relative_residual(R, B), unresolved.size == 0, start)
+
+@phase("solve")
+def compute_satellite_routes_jacobi(users, user_to_satellite, satellite_positions, connectivity, topology=None,
+                                    flow_dtype=np.float64, flow_threshold=None, max_iter=100, tol=1e-4, cache=None,
+                                    precision="float64"):
+    """
+    Args:
+        cache: optional RouteCache; pairs already solved on the same topology
+            with the same max_iter/tol/precision (in either direction) are
+            not re-solved
+        precision: "float64", or "mixed" for float32 sweeps with float64
+            refinement (solve_potential_jacobi_mixed)
+    """
+    check_precision(precision)
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    A, idx_map, nodes = topology.system_matrix()
+    num_pairs = len(users) * (len(users) - 1) // 2
+    results = FlowResults(nodes, idx_map, num_pairs, dtype=flow_dtype, threshold=flow_threshold)
+    token = topology_token(topology) if cache is not None else None
+    A32 = topology_float32(topology) if precision == "mixed" else None
+
+    def solve(sat1, sat2):
+        b = pair_rhs(len(nodes), sat1, sat2, idx_map)
+        if precision == "mixed":
+            return solve_potential_jacobi_mixed(A, b, max_iter=max_iter, tol=tol, A32=A32)[0]
+        return solve_potential_jacobi(A, b, max_iter=max_iter, tol=tol)[0]
 
     for user1, user2 in combinations(users, 2):
         uid1, uid2 = user1.get_id(), user2.get_id()
         sat1, sat2 = user_to_satellite[uid1], user_to_satellite[uid2]
 
-        if nx.has_path(satellite_graph, sat1, sat2):
-            flow = solve_flow_jacobi_sparse(A, idx_map, nodes, source=sat1, target=sat2)
-            total_flow = sum(abs(f) for f in flow.values())
-            results[(uid1, uid2)] = {
-                "flow": flow,
-                "total_flow": total_flow
-            }
+        if topology.connected(sat1, sat2):
+            if cache is None:
+                x = solve(sat1, sat2)
+            else:
+                x = cache.flow(token, "jacobi", (max_iter, tol, precision), sat1, sat2, solve)
+            results.add((uid1, uid2), x)
         else:
-            results[(uid1, uid2)] = {
-                "flow": None,
-                "total_flow": float("inf")
-            }
+            results.add((uid1, uid2), None)
+    return results
+
+@phase("solve")
+def compute_satellite_routes_jacobi_batched(users, user_to_satellite, satellite_positions, connectivity,
+                                            max_iter=100, tol=1e-4, topology=None,
+                                            flow_dtype=np.float64, flow_threshold=None, precision="float64"):
+    check_precision(precision)
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    A, idx_map, nodes = topology.system_matrix()
+
+    user_pairs = []
+    column_map = {}
+    for user1, user2 in combinations(users, 2):
+        uid1, uid2 = user1.get_id(), user2.get_id()
+        sat_pair = (user_to_satellite[uid1], user_to_satellite[uid2])
+        user_pairs.append((uid1, uid2, sat_pair))
+        if sat_pair not in column_map and topology.connected(*sat_pair):
+            column_map[sat_pair] = len(column_map)
+
+    B = pair_rhs_block(len(nodes), list(column_map), idx_map)
+
+    if precision == "mixed":
+        X, _ = solve_flow_jacobi_batched_mixed(A, B, max_iter=max_iter, tol=tol, A32=topology_float32(topology))
+    else:
+        X, _ = solve_flow_jacobi_batched(A, B, max_iter=max_iter, tol=tol)
+    results = FlowResults(nodes, idx_map, len(column_map), dtype=flow_dtype, threshold=flow_threshold)
+    slots = results.store_block(X)
+
+    for uid1, uid2, sat_pair in user_pairs:
+        results.assign((uid1, uid2), slots[column_map[sat_pair]] if sat_pair in column_map else None)
     return results
 
 if __name__ == "__main__":
@@ -96,7 +267,7 @@ if __name__ == "__main__":
 
     for (u1, u2), data in results.items():
         flow = data["flow"]
-        if flow:
+        if flow is not None:
             significant = {s: f for s, f in flow.items() if abs(f) > 0.01}
             print(f"User {u1} <-> User {u2}: Flow Path = [" + ", ".join(f"S{s}:{f:.2f}" for s, f in significant.items()) + "]")
         else:
@@ -0,0 +1,254 @@
+import time
+import numpy as np
+from itertools import combinations
+from scipy.sparse import csr_matrix, diags, identity
+from scipy.sparse.csgraph import connected_components
+from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology, pair_rhs
+from math_flow_results import FlowResults
+from math_instrumentation import phase, record_solve
+from math_gauss_seidel import multicolor_ordering, multicolor_sweeps, multicolor_sweep
+from math_direct import GroundedFactorization
+from math_network_setup import (
+    generate_sessions,
+    assign_users_to_closest_satellites,
+    plot_colored_user_satellite_graph,
+    print_user_satellite_pairs,
+    print_satellite_connectivity
+)
+
+
+COARSENINGS = ("auto", "geometric", "algebraic")
+
+
+def infer_grid_shape(satellite_positions, connectivity):
+    """
+    Recover (num_orbits, sats_per_orbit) when the constellation is a complete
+    orbit x slot grid as laid out by generate_synthetic_satellite_grid.
+    Returns None when the connectivity is not such a grid.
+    """
+    N = len(satellite_positions)
+    sats_per_orbit = np.unique(satellite_positions[:, 0]).size
+    if sats_per_orbit == 0 or N % sats_per_orbit:
+        return None
+    num_orbits = N // sats_per_orbit
+
+    for sid in range(N):
+        i, j = divmod(sid, sats_per_orbit)
+        expected = {((i + di) % num_orbits) * sats_per_orbit + j for di in (-1, 1)}
+        expected |= {i * sats_per_orbit + j + dj for dj in (-1, 1) if 0 <= j + dj < sats_per_orbit}
+        if set(connectivity.get(sid, ())) - {sid} != expected - {sid}:
+            return None
+    return num_orbits, sats_per_orbit
+
+
+def grid_aggregates(num_orbits, sats_per_orbit):
+    """Merge 2 x 2 blocks of the orbit x slot grid. Returns (aggregates, coarse shape)."""
+    coarse_orbits = (num_orbits + 1) // 2
+    coarse_slots = (sats_per_orbit + 1) // 2
+    i, j = np.divmod(np.arange(num_orbits * sats_per_orbit), sats_per_orbit)
+    return (i // 2) * coarse_slots + j // 2, (coarse_orbits, coarse_slots)
+
+
+def algebraic_aggregates(A):
+    """
+    Greedy neighbourhood aggregation for arbitrary connectivity: every
+    unaggregated node whose neighbours are all free seeds an aggregate with
+    them, and leftover nodes join a neighbouring aggregate.
+    """
+    A = A.tocsr()
+    N = A.shape[0]
+    aggregates = np.full(N, -1)
+    num_aggregates = 0
+
+    for i in range(N):
+        neighbors = A.indices[A.indptr[i]:A.indptr[i + 1]]
+        if np.all(aggregates[neighbors] == -1):
+            aggregates[neighbors] = num_aggregates
+            aggregates[i] = num_aggregates
+            num_aggregates += 1
+
+    for i in np.flatnonzero(aggregates == -1):
+        neighbors = A.indices[A.indptr[i]:A.indptr[i + 1]]
+        assigned = neighbors[aggregates[neighbors] >= 0]
+        if assigned.size:
+            aggregates[i] = aggregates[assigned[0]]
+        else:
+            aggregates[i] = num_aggregates
+            num_aggregates += 1
+
+    return aggregates
+
+
+class MultigridLevel:
+    def __init__(self, A, smoother):
+        self.A = A.tocsr()
+        self.A_diag_inv = 1.0 / self.A.diagonal()
+        self.P = None
+        if smoother == "gauss_seidel":
+            self.sweeps = multicolor_sweeps(self.A, multicolor_ordering(self.A))
+
+
+class MultigridHierarchy:
+    """
+    Smoothed-aggregation multigrid hierarchy for the satellite Laplacian.
+
+    With a grid_shape (num_orbits, sats_per_orbit) the aggregates are 2 x 2
+    blocks of the orbit/slot grid, so every level halves both dimensions.
+    Otherwise algebraic aggregation is used. Tentative piecewise-constant
+    prolongators are smoothed with one damped Jacobi step, the coarse
+    operators are Galerkin products, and the coarsest level is solved exactly.
+    """
+
+    def __init__(self, A, grid_shape=None, smoother="gauss_seidel", coarse_size=64, max_levels=20):
+        self.smoother = smoother
+        self.levels = [MultigridLevel(A, smoother)]
+        _, self.labels = connected_components(self.levels[0].A, directed=False)
+        self.component_sizes = np.bincount(self.labels)
+
+        while self.levels[-1].A.shape[0] > coarse_size and len(self.levels) < max_levels:
+            level = self.levels[-1]
+            N = level.A.shape[0]
+            if grid_shape is not None:
+                aggregates, grid_shape = grid_aggregates(*grid_shape)
+            else:
+                aggregates = algebraic_aggregates(level.A)
+            num_coarse = aggregates.max() + 1
+            if num_coarse >= N:
+                break
+
+            tentative = csr_matrix((np.ones(N), (np.arange(N), aggregates)), shape=(N, num_coarse))
+            smoothing = identity(N, format="csr") - (2.0 / 3.0) * diags(level.A_diag_inv) @ level.A
+            level.P = (smoothing @ tentative).tocsr()
+            A_coarse = (level.P.T @ level.A @ level.P).tocsr()
+            self.levels.append(MultigridLevel(A_coarse, smoother))
+
+        self.coarse_solver = GroundedFactorization(self.levels[-1].A)
+
+    def smooth(self, level, x, b, sweeps):
+        for _ in range(sweeps):
+            if self.smoother == "gauss_seidel":
+                multicolor_sweep(level.sweeps, x, b)
+            else:
+                x += (2.0 / 3.0) * level.A_diag_inv * (b - level.A @ x)
+        return x
+
+    def cycle(self, b, x, depth=0, gamma=1, pre_sweeps=1, post_sweeps=1):
+        level = self.levels[depth]
+        if depth == len(self.levels) - 1:
+            return self.coarse_solver.solve(b)
+
+        x = self.smooth(level, x, b, pre_sweeps)
+        residual_coarse = level.P.T @ (b - level.A @ x)
+        correction = np.zeros(residual_coarse.shape)
+        for _ in range(gamma):
+            correction = self.cycle(residual_coarse, correction, depth + 1, gamma, pre_sweeps, post_sweeps)
+        x += level.P @ correction
+        return self.smooth(level, x, b, post_sweeps)
+
+
+def solve_potential_multigrid(hierarchy, b, x0=None, cycle="V", max_iter=50, tol=1e-6):
+    """
+    Repeat V (gamma=1) or W (gamma=2) cycles until ||b - A x||_2 <= tol * ||b||_2.
+    Returns:
+        x: np.ndarray shape [N], zero mean on every component
+        stats: SolveStats, iterations counts cycles
+    """
+    start = time.perf_counter()
+    gamma = {"V": 1, "W": 2}[cycle]
+    A = hierarchy.levels[0].A
+    x = np.zeros(A.shape[0]) if x0 is None else x0.copy()
+    b_norm = np.linalg.norm(b)
+    if b_norm == 0:
+        return x, record_solve("multigrid", 0, 0.0, True, start)
+
+    iterations = 0
+    residual = np.inf
+    for iterations in range(1, max_iter + 1):
+        x = hierarchy.cycle(b, x, gamma=gamma)
+        residual = np.linalg.norm(b - A @ x) / b_norm
+        if residual <= tol:
+            break
+
+    component_means = np.bincount(hierarchy.labels, weights=x) / hierarchy.component_sizes
+    return x - component_means[hierarchy.labels], record_solve("multigrid", iterations, residual, residual <= tol, start)
+
+
+def solve_flow_multigrid(hierarchy, idx_map, nodes, source, target, cycle="V", max_iter=50, tol=1e-6):
+    b = pair_rhs(len(nodes), source, target, idx_map)
+
+    x, _ = solve_potential_multigrid(hierarchy, b, cycle=cycle, max_iter=max_iter, tol=tol)
+    return {node: x[idx_map[node]] for node in nodes}
+
+
+@phase("solve")
+def compute_satellite_routes_multigrid(users, user_to_satellite, satellite_positions, connectivity,
+                                       cycle="V", smoother="gauss_seidel", topology=None,
+                                       flow_dtype=np.float64, flow_threshold=None, grid_shape=None,
+                                       coarsening="auto"):
+    """
+    Args:
+        grid_shape: (num_orbits, sats_per_orbit) for geometric coarsening.
+            Inferred from satellite_positions/connectivity when not given.
+        coarsening: "geometric" requires a grid_shape (given or inferred),
+            "algebraic" ignores it, and "auto" coarsens geometrically when
+            a grid_shape is available and algebraically otherwise.
+    """
+    if coarsening not in COARSENINGS:
+        raise ValueError(f"coarsening must be one of {COARSENINGS}, got {coarsening!r}")
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    A, idx_map, nodes = topology.system_matrix()
+
+    if coarsening == "algebraic":
+        grid_shape = None
+    elif grid_shape is None and connectivity is not None:
+        grid_shape = infer_grid_shape(satellite_positions, connectivity)
+    if coarsening == "geometric" and grid_shape is None:
+        raise ValueError("geometric coarsening needs a grid_shape or a complete orbit x slot grid")
+    hierarchy = MultigridHierarchy(A, grid_shape=grid_shape, smoother=smoother)
+    num_pairs = len(users) * (len(users) - 1) // 2
+    results = FlowResults(nodes, idx_map, num_pairs, dtype=flow_dtype, threshold=flow_threshold)
+
+    for user1, user2 in combinations(users, 2):
+        uid1, uid2 = user1.get_id(), user2.get_id()
+        sat1, sat2 = user_to_satellite[uid1], user_to_satellite[uid2]
+
+        if topology.connected(sat1, sat2):
+            b = pair_rhs(len(nodes), sat1, sat2, idx_map)
+            x, _ = solve_potential_multigrid(hierarchy, b, cycle=cycle)
+            results.add((uid1, uid2), x)
+        else:
+            results.add((uid1, uid2), None)
+    return results
+
+
+if __name__ == "__main__":
+    num_satellites = 50
+    num_sessions = 1
+    users_per_session = 10
+
+    satellite_positions, connectivity = generate_synthetic_satellite_grid(
+        num_satellites, lat_range=(30, 55), lon_range=(-140, 160))
+
+    sessions = generate_sessions(num_sessions, users_per_session)
+    session = sessions[0]
+    users = session.get_user()
+
+    user_to_satellite_map = assign_users_to_closest_satellites(users, satellite_positions)
+    print_user_satellite_pairs(users, user_to_satellite_map)
+    print_satellite_connectivity(connectivity)
+
+    print("\nUser Pair Routing via Multigrid V-Cycle:")
+    results = compute_satellite_routes_multigrid(users, user_to_satellite_map, satellite_positions, connectivity)
+
+    for (u1, u2), data in results.items():
+        flow = data["flow"]
+        if flow is not None:
+            significant = {s: f for s, f in flow.items() if abs(f) > 0.01}
+            print(f"User {u1} <-> User {u2}: Flow Path = [" + ", ".join(
+                f"S{s}:{f:.2f}" for s, f in significant.items()) + "]")
+        else:
+            print(f"User {u1} <-> User {u2}: No valid flow path")
+
+    plot_colored_user_satellite_graph(session.get_user(), satellite_positions, user_to_satellite_map)
@@ -1,11 +1,14 @@
-import random
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LogNorm
 import networkx as nx
 
-from math_users_information import USER
+from math_users_information import UserTable, user_locations, user_ids, user_cities
 from math_session_information import SESSION
 from math_satellites import generate_synthetic_satellite_grid, calculate_latency
+from math_spatial_index import get_spatial_index
+from math_instrumentation import phase
 
 
 CITY_COORDINATES = {
@@ -17,118 +20,192 @@ CITY_COORDINATES = {
     "Sydney": (33.8688, 151.2093),
 }
 
-
-def generate_sessions(num_sessions, max_users_per_session):
-    sessions = []
-    user_id = 0
-
-    for session_id in range(num_sessions):
-        session = SESSION(session_id)
-        for _ in range(max_users_per_session):
-            city = random.choice(list(CITY_COORDINATES.keys()))
-            base_lat, base_lon = CITY_COORDINATES[city]
-            lat = base_lat + random.uniform(-2.0, 2.0)
-            lon = base_lon + random.uniform(-2.0, 2.0)
-            timestamp = random.randint(1609459200, 1672444800)
-
-            user = USER(user_id, city, lat, lon, timestamp, session_id)
-            session.add_user(user)
-            user_id += 1
-
-        sessions.append(session)
-    return sessions
-
-
-def assign_users_to_closest_satellites(users, satellite_positions):
-    user_to_satellite = {}
-
-    for user in users:
-        user_lat, user_lon = user.get_location()
-        distances = np.sqrt((satellite_positions[:, 0] - user_lat) ** 2 +
-                            (satellite_positions[:, 1] - user_lon) ** 2)
-        closest_idx = np.argmin(distances)
-        user_to_satellite[user.get_id()] = closest_idx
-
-    return user_to_satellite
+CITY_COLORS = {
+    "New York": "green",
+    "Los Angeles": "orange",
+    "London": "blue",
+    "Tokyo": "purple",
+    "Paris": "pink",
+    "Sydney": "cyan",
+}
 
 
-def plot_user_satellite_graph(users, satellite_positions, user_to_satellite_map):
-    fig, ax = plt.subplots(figsize=(12, 6))
+def generate_user_table(num_sessions, max_users_per_session, seed=None):
+    """
+    Generate every user of every session in one vectorized pass.
+    Returns:
+        UserTable with num_sessions * max_users_per_session rows, session-major
+    """
+    rng = np.random.default_rng(seed)
+    city_names = list(CITY_COORDINATES)
+    base = np.array([CITY_COORDINATES[city] for city in city_names])
+    num_users = num_sessions * max_users_per_session
+
+    city_code = rng.integers(0, len(city_names), num_users)
+    jitter = rng.uniform(-2.0, 2.0, (num_users, 2))
+    return UserTable(
+        user_id=np.arange(num_users),
+        city_code=city_code,
+        latitude=base[city_code, 0] + jitter[:, 0],
+        longitude=base[city_code, 1] + jitter[:, 1],
+        create_time=rng.integers(1609459200, 1672444800, num_users, endpoint=True),
+        session_id=np.repeat(np.arange(num_sessions), max_users_per_session),
+        city_names=city_names,
+    )
 
-    sat_lats = satellite_positions[:, 0]
-    sat_lons = satellite_positions[:, 1]
-    ax.scatter(sat_lons, sat_lats, c='red', label='Satellites')
 
-    user_lats = [u.get_location()[0] for u in users]
-    user_lons = [u.get_location()[1] for u in users]
-    ax.scatter(user_lons, user_lats, c='blue', label='Users')
+def generate_sessions(num_sessions, max_users_per_session, seed=None):
+    """
+    SESSION objects over slices of one generated UserTable. USER objects are
+    only built for the sessions whose get_user() is called.
+    """
+    table = generate_user_table(num_sessions, max_users_per_session, seed=seed)
+    slices = table.session_slices(np.arange(num_sessions))
+    return [SESSION(session_id, users) for session_id, users in enumerate(slices)]
 
-    for i, (lat, lon) in enumerate(satellite_positions):
-        ax.text(lon, lat, f"S{i}", fontsize=7, color='black', ha='center', va='center')
 
-    for user in users:
-        user_lat, user_lon = user.get_location()
-        ax.text(user_lon, user_lat, f"U{user.get_id()}", fontsize=7, color='blue')
+@phase("assignment")
+def assign_satellite_indices(users, satellite_positions):
+    """Nearest satellite for every user as an int array aligned with `users`."""
+    lats, lons = user_locations(users)
+    if len(lats) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return get_spatial_index(satellite_positions).nearest(lats, lons)
 
-        sat_id = user_to_satellite_map[user.get_id()]
-        sat_lat, sat_lon = satellite_positions[sat_id]
-        ax.plot([user_lon, sat_lon], [user_lat, sat_lat], color='green', lw=0.5)
 
-    #ax.set_xlim(-130, 170)
-    #ax.set_ylim(0, 70)
+def assign_users_to_closest_satellites(users, satellite_positions):
+    """Map each user id to its great-circle nearest satellite in one batched query."""
+    closest = assign_satellite_indices(users, satellite_positions)
+    return dict(zip(user_ids(users).tolist(), closest.tolist()))
+
+
+def _new_figure(path, figsize):
+    """pyplot figure for interactive display, or a standalone Agg figure when saving to path (headless)."""
+    if path is None:
+        return plt.subplots(figsize=figsize)
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _user_satellite_arrays(users, user_to_satellite_map):
+    """Latitudes, longitudes, ids and assigned satellites of all users as aligned arrays."""
+    lats, lons = (np.asarray(a, dtype=float) for a in user_locations(users))
+    ids = user_ids(users)
+    if isinstance(user_to_satellite_map, np.ndarray):
+        sats = user_to_satellite_map
+    else:
+        sats = np.fromiter((user_to_satellite_map[uid] for uid in ids.tolist()), dtype=np.int64, count=ids.size)
+    return lats, lons, ids, sats
+
+
+def _render_user_satellite_graph(users, satellite_positions, user_to_satellite_map, style, path, labels,
+                                 max_labels, max_points, density_bins, dpi, seed):
+    """
+    Draw satellites with one scatter, users with one scatter per class and
+    every user -> satellite link with one LineCollection, so the artist count
+    does not grow with the population. Above max_points users a uniform
+    random sample is drawn (and linked); with density_bins the users are
+    drawn as one log-scaled 2D histogram image instead. Labels are drawn
+    for at most max_labels satellites and max_labels users.
+    """
+    lats, lons, ids, sats = _user_satellite_arrays(users, user_to_satellite_map)
+    num_users = ids.size
+    shown = np.arange(num_users)
+    if max_points is not None and num_users > max_points:
+        shown = np.sort(np.random.default_rng(seed).choice(num_users, max_points, replace=False))
+
+    fig, ax = _new_figure(path, (12, 6))
+    sat_lats, sat_lons = satellite_positions[:, 0], satellite_positions[:, 1]
+    ax.scatter(sat_lons, sat_lats, label='Satellites', rasterized=True, **style["satellites"])
+
+    if density_bins is not None:
+        counts, lon_edges, lat_edges = np.histogram2d(lons, lats, bins=density_bins)
+        image = ax.pcolormesh(lon_edges, lat_edges, np.ma.masked_equal(counts.T, 0), cmap="viridis",
+                              norm=LogNorm(), rasterized=True)
+        fig.colorbar(image, ax=ax, label="Users per bin")
+    elif style["classes"] is None:
+        ax.scatter(lons[shown], lats[shown], label='Users', rasterized=True, **style["users"])
+    else:
+        classes = style["classes"](users)[shown]
+        for name in dict.fromkeys(classes.tolist()):
+            members = shown[classes == name]
+            ax.scatter(lons[members], lats[members], color=style["class_colors"].get(name, "gray"), label=name,
+                       rasterized=True, **style["users"])
+
+    segments = np.stack([np.column_stack([lons[shown], lats[shown]]),
+                         np.column_stack([sat_lons[sats[shown]], sat_lats[sats[shown]]])], axis=1)
+    ax.add_collection(LineCollection(segments, rasterized=True, **style["links"]))
+
+    if labels:
+        for sat_id in range(min(len(satellite_positions), max_labels)):
+            ax.text(sat_lons[sat_id], sat_lats[sat_id], f"S{sat_id}", **style["satellite_labels"])
+        for i in shown[:max_labels].tolist():
+            ax.text(lons[i], lats[i], f"U{ids[i]}", **style["user_labels"])
+
+    title = style["title"]
+    if shown.size < num_users and density_bins is None:
+        title += f" ({shown.size} of {num_users} users shown)"
     ax.set_xlabel("Longitude")
     ax.set_ylabel("Latitude")
-    ax.set_title("User ↔ Satellite Connections")
-    ax.legend()
+    ax.set_title(title)
+    ax.legend(loc=style["legend_loc"])
     ax.grid(True)
-    plt.show()
-
-
-def plot_colored_user_satellite_graph(users, satellite_positions, user_to_satellite_map):
-    fig, ax = plt.subplots(figsize=(12, 6))
-
-    # Satellite positions
-    sat_lats = satellite_positions[:, 0]
-    sat_lons = satellite_positions[:, 1]
-    ax.scatter(sat_lons, sat_lats, color='red', label='Satellites', alpha=0.7)
-    for sat_id, (lat, lon) in enumerate(satellite_positions):
-        ax.text(lon, lat, f"S{sat_id}", color='black', fontsize=6, ha='center', va='center')
-
-    # User positions by city
-    city_colors = {
-        "New York": "green",
-        "Los Angeles": "orange",
-        "London": "blue",
-        "Tokyo": "purple",
-        "Paris": "pink",
-        "Sydney": "cyan",
+    fig.tight_layout()
+
+    if path is None:
+        plt.show()
+    else:
+        fig.savefig(path, dpi=dpi)
+    return fig
+
+
+def plot_user_satellite_graph(users, satellite_positions, user_to_satellite_map, path=None, labels=True,
+                              max_labels=200, max_points=20000, density_bins=None, dpi=150, seed=0):
+    """
+    Plot users, satellites and user -> satellite links.
+    Args:
+        users: list of USER or a UserTable
+        user_to_satellite_map: {uid: sat_id}, or a satellite array aligned with users
+        path: save the figure to this file (headless, rasterized) instead of showing it
+        labels, max_labels: draw at most max_labels satellite and user labels
+        max_points: users beyond this many are randomly sampled (seeded by seed)
+        density_bins: draw users as a 2D histogram with this many bins per axis
+    Returns:
+        matplotlib Figure
+    """
+    style = {
+        "title": "User ↔ Satellite Connections",
+        "satellites": {"c": 'red'},
+        "users": {"c": 'blue'},
+        "classes": None,
+        "links": {"colors": 'green', "linewidths": 0.5},
+        "satellite_labels": {"fontsize": 7, "color": 'black', "ha": 'center', "va": 'center'},
+        "user_labels": {"fontsize": 7, "color": 'blue'},
+        "legend_loc": "best",
     }
-
-    for user in users:
-        user_lat, user_lon = user.get_location()
-        city = user.get_city()
-        color = city_colors.get(city, "gray")
-        ax.scatter(user_lon, user_lat, color=color, alpha=0.7, s=30, label=city)
-        ax.text(user_lon, user_lat, f"U{user.get_id()}", fontsize=6, color='black', ha='center', va='center')
-
-        # User → Satellite line
-        sat_id = user_to_satellite_map[user.get_id()]
-        sat_lat, sat_lon = satellite_positions[sat_id]
-        ax.plot([user_lon, sat_lon], [user_lat, sat_lat], color='gray', lw=0.5, alpha=0.5)
-
-    # Remove duplicate city entries in legend
-    handles, labels = ax.get_legend_handles_labels()
-    by_label = dict(zip(labels, handles))
-    ax.legend(by_label.values(), by_label.keys(), loc='upper left')
-
-
-    ax.set_xlabel('Longitude')
-    ax.set_ylabel('Latitude')
-    ax.set_title('User ↔ Satellite Connections (Colored by City)')
-    ax.grid(True)
-
-    plt.tight_layout()
-    plt.show()
+    return _render_user_satellite_graph(users, satellite_positions, user_to_satellite_map, style, path, labels,
+                                        max_labels, max_points, density_bins, dpi, seed)
+
+
+def plot_colored_user_satellite_graph(users, satellite_positions, user_to_satellite_map, path=None, labels=True,
+                                      max_labels=200, max_points=20000, density_bins=None, dpi=150, seed=0):
+    """plot_user_satellite_graph with users coloured by city, one scatter per city."""
+    style = {
+        "title": "User ↔ Satellite Connections (Colored by City)",
+        "satellites": {"color": 'red', "alpha": 0.7},
+        "users": {"alpha": 0.7, "s": 30},
+        "classes": user_cities,
+        "class_colors": CITY_COLORS,
+        "links": {"colors": 'gray', "linewidths": 0.5, "alpha": 0.5},
+        "satellite_labels": {"fontsize": 6, "color": 'black', "ha": 'center', "va": 'center'},
+        "user_labels": {"fontsize": 6, "color": 'black', "ha": 'center', "va": 'center'},
+        "legend_loc": "upper left",
+    }
+    return _render_user_satellite_graph(users, satellite_positions, user_to_satellite_map, style, path, labels,
+                                        max_labels, max_points, density_bins, dpi, seed)
 
 
 def print_user_satellite_pairs(users, user_to_satellite):
@@ -0,0 +1,200 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from multiprocessing import shared_memory
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology, pair_rhs
+from math_jacobi import solve_potential_jacobi
+from math_gauss_seidel import multicolor_ordering, multicolor_sweeps, solve_potential_gauss_seidel
+from math_greedy import reconstruct_path
+from math_flow_results import FlowResults
+from math_network_setup import (
+    generate_sessions,
+    assign_users_to_closest_satellites,
+)
+
+
+def share_array(array):
+    """
+    Copy an array into a new shared-memory block.
+    Returns:
+        shm: SharedMemory (the caller must close and unlink it)
+        descriptor: (name, shape, dtype string) for attach_array
+    """
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def attach_array(descriptor):
+    """Map a shared block as an ndarray without copying. Returns (shm, array)."""
+    name, shape, dtype = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+_worker = {}
+
+
+def _init_worker(descriptors, method, solver_options):
+    arrays = {}
+    for key, descriptor in descriptors.items():
+        shm, arrays[key] = attach_array(descriptor)
+        _worker.setdefault("shm", []).append(shm)
+
+    num_nodes = arrays["labels"].size
+    _worker["method"] = method
+    _worker["options"] = solver_options
+    _worker["labels"] = arrays["labels"]
+    _worker["positions"] = arrays["positions"]
+    if method == "dijkstra":
+        _worker["W"] = csr_matrix((arrays["w_data"], arrays["w_indices"], arrays["w_indptr"]),
+                                  shape=(num_nodes, num_nodes), copy=False)
+    else:
+        _worker["A"] = csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                                  shape=(num_nodes, num_nodes), copy=False)
+    if method == "gauss_seidel":
+        colors = arrays["colors"]
+        classes = [np.flatnonzero(colors == c) for c in range(colors.max() + 1)]
+        _worker["sweeps"] = multicolor_sweeps(_worker["A"], classes)
+
+
+def _route_chunk(chunk):
+    """Route a list of (k, sat1, sat2) pairs inside a worker; k is the pair's position."""
+    method = _worker["method"]
+    labels = _worker["labels"]
+    out = []
+
+    if method == "dijkstra":
+        sources = sorted({sat1 for _, sat1, _ in chunk})
+        distances, predecessors = dijkstra(_worker["W"], directed=False, indices=sources,
+                                           return_predecessors=True)
+        row_map = {s: row for row, s in enumerate(sources)}
+        for k, sat1, sat2 in chunk:
+            if labels[sat1] != labels[sat2]:
+                out.append((k, float("inf"), None))
+                continue
+            row = row_map[sat1]
+            out.append((k, float(distances[row, sat2]), reconstruct_path(predecessors[row], sat1, sat2)))
+        return out
+
+    A = _worker["A"]
+    options = _worker["options"]
+    for k, sat1, sat2 in chunk:
+        if labels[sat1] != labels[sat2]:
+            out.append((k, None))
+            continue
+        b = pair_rhs(A.shape[0], sat1, sat2)
+        if method == "gauss_seidel":
+            x, _ = solve_potential_gauss_seidel(_worker["sweeps"], b, **options)
+        else:
+            x, _ = solve_potential_jacobi(A, b, **options)
+        out.append((k, x))
+    return out
+
+
+def compute_satellite_routes_parallel(users, user_to_satellite, satellite_positions, connectivity,
+                                      method="jacobi", workers=None, chunk_size=256, topology=None,
+                                      **solver_options):
+    """
+    Shard combinations(users, 2) across a process pool.
+
+    The CSR arrays (indptr, indices, data), the satellite positions and the
+    component labels are placed in multiprocessing.shared_memory once, and
+    workers map them without copying. Results are merged into the same
+    format as the serial compute_satellite_routes_* function for `method`
+    ("jacobi", "gauss_seidel" or "dijkstra"), in the same key order.
+
+    Args:
+        workers: process count (default os.cpu_count())
+        chunk_size: user pairs per task; larger chunks amortize IPC, smaller
+            ones balance load
+        solver_options: forwarded to the iterative solver (max_iter, tol,
+            and omega for gauss_seidel)
+    """
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    workers = workers or os.cpu_count()
+
+    A = topology.laplacian
+    shared = {"labels": topology.labels, "positions": np.asarray(satellite_positions, dtype=float)}
+    if method == "dijkstra":
+        W = topology.weighted_adjacency()
+        shared.update(w_indptr=W.indptr, w_indices=W.indices, w_data=W.data)
+    else:
+        shared.update(indptr=A.indptr, indices=A.indices, data=A.data)
+    if method == "gauss_seidel":
+        classes = multicolor_ordering(A)
+        colors = np.zeros(topology.num_nodes, dtype=np.int32)
+        for c, idx in enumerate(classes):
+            colors[idx] = c
+        shared["colors"] = colors
+
+    keys, pairs = [], []
+    for user1, user2 in combinations(users, 2):
+        uid1, uid2 = user1.get_id(), user2.get_id()
+        pairs.append((len(keys), int(user_to_satellite[uid1]), int(user_to_satellite[uid2])))
+        keys.append((uid1, uid2))
+    # Pairs in one chunk then share source satellites, which helps Dijkstra
+    pairs.sort(key=lambda pair: pair[1])
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+
+    blocks, descriptors = [], {}
+    try:
+        for key, array in shared.items():
+            shm, descriptors[key] = share_array(array)
+            blocks.append(shm)
+
+        routes = [None] * len(keys)
+        if method != "dijkstra":
+            flows = FlowResults(topology.nodes, topology.idx_map, len(keys))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(descriptors, method, solver_options)) as pool:
+            for part in pool.map(_route_chunk, chunks):
+                for record in part:
+                    if method == "dijkstra":
+                        k, latency, path = record
+                        routes[k] = {"latency": latency, "path": path}
+                    else:
+                        k, x = record
+                        routes[k] = None if x is None else flows.store(x)
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    # Same key order as the serial routers
+    if method == "dijkstra":
+        return dict(zip(keys, routes))
+    for key, slot in zip(keys, routes):
+        flows.assign(key, slot)
+    return flows
+
+
+if __name__ == "__main__":
+    import time
+    from math_jacobi import compute_satellite_routes_jacobi
+
+    num_satellites = 100
+    users_per_session = 60
+
+    satellite_positions, connectivity = generate_synthetic_satellite_grid(
+        num_satellites, lat_range=(30, 55), lon_range=(-140, 160))
+    users = generate_sessions(1, users_per_session)[0].get_user()
+    user_to_satellite_map = assign_users_to_closest_satellites(users, satellite_positions)
+
+    start = time.perf_counter()
+    serial = compute_satellite_routes_jacobi(users, user_to_satellite_map, satellite_positions, connectivity)
+    print(f"Serial Jacobi: {time.perf_counter() - start:.2f}s for {len(serial)} pairs")
+
+    for workers in (1, 2, 4, os.cpu_count()):
+        start = time.perf_counter()
+        parallel = compute_satellite_routes_parallel(users, user_to_satellite_map, satellite_positions,
+                                                     connectivity, method="jacobi", workers=workers)
+        elapsed = time.perf_counter() - start
+        agree = all(np.isclose(parallel[key]["total_flow"], serial[key]["total_flow"]) for key in serial)
+        print(f"Parallel Jacobi, {workers} workers: {elapsed:.2f}s (matches serial: {agree})")
@@ -0,0 +1,112 @@
+import numpy as np
+from collections import deque
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+class ReachabilityIndex:
+    """
+    Connected-component labels of the satellite graph with incremental updates.
+
+    connected() compares two entries of a label array, so every reachability
+    query is O(1). Restoring a link merges two components union-by-size
+    (the smaller member set is relabelled). Failing a link runs a
+    bidirectional BFS from its endpoints that stops as soon as the two
+    searches meet, or as soon as one side is exhausted; only that side is
+    relabelled, so the cost is bounded by the smaller resulting component.
+    """
+
+    def __init__(self, num_nodes, edge_u, edge_v, labels=None):
+        self.num_nodes = num_nodes
+        self.edge_u = edge_u
+        self.edge_v = edge_v
+        if labels is None:
+            graph = _edge_graph(num_nodes, edge_u, edge_v)
+            _, labels = connected_components(graph, directed=False)
+        self.labels = np.array(labels, dtype=np.int64)
+        self._members = None
+        self._adjacency = None
+        self._next_label = int(self.labels.max(initial=-1)) + 1
+
+    def connected(self, sat1, sat2):
+        return self.labels[sat1] == self.labels[sat2]
+
+    def component_size(self, sat_id):
+        return len(self._member_sets()[self.labels[sat_id]])
+
+    def _member_sets(self):
+        if self._members is None:
+            order = np.argsort(self.labels, kind="stable")
+            boundaries = np.flatnonzero(np.diff(self.labels[order])) + 1
+            self._members = {int(self.labels[group[0]]): set(group.tolist())
+                             for group in np.split(order, boundaries) if group.size}
+        return self._members
+
+    def _neighbor_sets(self):
+        if self._adjacency is None:
+            self._adjacency = [set() for _ in range(self.num_nodes)]
+            for u, v in zip(self.edge_u.tolist(), self.edge_v.tolist()):
+                self._adjacency[u].add(v)
+                self._adjacency[v].add(u)
+        return self._adjacency
+
+    def add_link(self, u, v):
+        """Restore (or add) the link u-v, merging components if needed."""
+        adjacency = self._neighbor_sets()
+        members = self._member_sets()
+        adjacency[u].add(v)
+        adjacency[v].add(u)
+
+        label_u, label_v = int(self.labels[u]), int(self.labels[v])
+        if label_u == label_v:
+            return
+        if len(members[label_u]) < len(members[label_v]):
+            label_u, label_v = label_v, label_u
+        moved = members.pop(label_v)
+        self.labels[list(moved)] = label_u
+        members[label_u] |= moved
+
+    def remove_link(self, u, v):
+        """Fail the link u-v, splitting its component if it was a bridge."""
+        adjacency = self._neighbor_sets()
+        members = self._member_sets()
+        adjacency[u].discard(v)
+        adjacency[v].discard(u)
+        if self.labels[u] != self.labels[v]:
+            return
+
+        side = _smaller_side_if_split(adjacency, u, v)
+        if side is None:
+            return
+        old_label = int(self.labels[u])
+        new_label = self._next_label
+        self._next_label += 1
+        self.labels[list(side)] = new_label
+        members[old_label] -= side
+        members[new_label] = side
+
+
+def _edge_graph(num_nodes, edge_u, edge_v):
+    data = np.ones(len(edge_u), dtype=np.int8)
+    return coo_matrix((data, (edge_u, edge_v)), shape=(num_nodes, num_nodes))
+
+
+def _smaller_side_if_split(adjacency, u, v):
+    """
+    Interleaved BFS from u and v. Returns None if they are still connected,
+    otherwise the node set of whichever side was exhausted first.
+    """
+    visited = ({u}, {v})
+    queues = (deque([u]), deque([v]))
+    while queues[0] and queues[1]:
+        for side in (0, 1):
+            node = queues[side].popleft()
+            for nbr in adjacency[node]:
+                if nbr in visited[1 - side]:
+                    return None
+                if nbr not in visited[side]:
+                    visited[side].add(nbr)
+                    queues[side].append(nbr)
+            if not queues[side]:
+                return visited[side]
+    return visited[0] if not queues[0] else visited[1]
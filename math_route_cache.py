@@ -0,0 +1,139 @@
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def topology_token(topology, weighted=False):
+    """
+    Content hash identifying the system the routes were solved on: the CSR
+    Laplacian, plus the latency matrix when weighted. It changes whenever a
+    link changes (or, for weighted, a latency changes), so stale routes are
+    never served after a topology update.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    matrices = [topology.laplacian]
+    if weighted:
+        matrices.append(topology.weighted_adjacency())
+    for matrix in matrices:
+        for array in (matrix.indptr, matrix.indices, matrix.data):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+class RouteCache:
+    """
+    Bounded LRU memo of per-satellite-pair routes, shared across sessions.
+
+    Keys are (topology token, method, solver params, sat1, sat2) with the
+    satellite pair stored in ascending order. Potentials are antisymmetric
+    in the pair (every solver here is linear and starts from zero), so a
+    lookup for (t, s) returns the cached (s, t) potential negated; Dijkstra
+    routes are returned with the path reversed. Entries are evicted least
+    recently used first once their total size exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes=256 << 20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def _store(self, key, value, size):
+        size += _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.nbytes -= previous[1]
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_size
+            self.evictions += 1
+
+    def flow(self, token, method, params, sat1, sat2, solve):
+        """
+        Potential for the pair, from the cache or from solve(sat1, sat2).
+        The returned array is read-only.
+        """
+        flipped = sat1 > sat2
+        key = (token, method, params) + ((sat2, sat1) if flipped else (sat1, sat2))
+        x = self._lookup(key)
+        if x is None:
+            x = solve(*key[-2:])
+            x = np.array(x, dtype=float)
+            x.setflags(write=False)
+            self._store(key, x, x.nbytes)
+        return -x if flipped else x
+
+    def contains_route(self, token, method, sat1, sat2):
+        return (token, method, ()) + (min(sat1, sat2), max(sat1, sat2)) in self._entries
+
+    def route(self, token, method, sat1, sat2, solve):
+        """(latency, path) for the pair, from the cache or from solve(sat1, sat2)."""
+        flipped = sat1 > sat2
+        key = (token, method, ()) + ((sat2, sat1) if flipped else (sat1, sat2))
+        value = self._lookup(key)
+        if value is None:
+            latency, path = solve(*key[-2:])
+            value = (latency, None if path is None else tuple(path))
+            self._store(key, value, 8 * len(value[1] or ()))
+        latency, path = value
+        if path is None:
+            return latency, None
+        return latency, list(path[::-1] if flipped else path)
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+if __name__ == "__main__":
+    import time
+    from math_satellites import generate_synthetic_satellite_grid
+    from math_topology import build_topology
+    from math_network_setup import generate_sessions, assign_users_to_closest_satellites
+    from math_jacobi import compute_satellite_routes_jacobi
+    from math_greedy import compute_satellite_routes_dijkstra
+
+    satellite_positions, connectivity = generate_synthetic_satellite_grid(100)
+    topology = build_topology(satellite_positions, connectivity)
+    cache = RouteCache()
+
+    for router in (compute_satellite_routes_jacobi, compute_satellite_routes_dijkstra):
+        for run in ("first", "repeat"):
+            start = time.perf_counter()
+            for session in generate_sessions(5, 20, seed=0):
+                users = session.get_user()
+                user_to_satellite = assign_users_to_closest_satellites(users, satellite_positions)
+                router(users, user_to_satellite, satellite_positions, connectivity, topology=topology, cache=cache)
+            elapsed = time.perf_counter() - start
+            print(f"{router.__name__} ({run} pass): {elapsed * 1e3:.1f} ms, {cache.stats()}")
@@ -1,9 +1,47 @@
 import numpy as np
+from collections.abc import Mapping
 import matplotlib.pyplot as plt
+from math_instrumentation import phase
 
 SPEED_OF_LIGHT = 299792.458  # km/s
+EARTH_RADIUS_KM = 6371.0
+EARTH_MU = 398600.4418  # km^3/s^2
+EARTH_ROTATION_DEG_S = 360.0 / 86164.0905  # sidereal day
 
 
+class ConnectivityView(Mapping):
+    """
+    Read-only {sat_id: [neighbor_ids]} view over CSR neighbour arrays.
+
+    Neighbours of satellite i are indices[indptr[i]:indptr[i + 1]]. The arrays
+    stay int32 and compact; the view only materializes a list on lookup, so
+    callers written against the connectivity dict keep working.
+    """
+
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+
+    def __getitem__(self, sat_id):
+        if not 0 <= sat_id < len(self):
+            raise KeyError(sat_id)
+        return self.indices[self.indptr[sat_id]:self.indptr[sat_id + 1]].tolist()
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def __len__(self):
+        return self.indptr.size - 1
+
+
+def _neighbors_to_csr(candidates, valid):
+    """Pack a [N, K] candidate table into CSR, keeping candidate order per row."""
+    indptr = np.zeros(candidates.shape[0] + 1, dtype=np.int32)
+    np.cumsum(valid.sum(axis=1), out=indptr[1:])
+    return ConnectivityView(indptr, candidates[valid].astype(np.int32))
+
+
+@phase("graph_build")
 def generate_synthetic_satellite_grid(num_satellites=100, lat_range = (30, 55),
     lon_range = (-140, 160)):
     """
@@ -14,7 +52,7 @@ def generate_synthetic_satellite_grid(num_satellites=100, lat_range = (30, 55),
         lon_range: tuple (min_lon, max_lon)
     Returns:
         satellite_positions: np.array shape [N, 2] (lat, lon)
-        connectivity_dict: {sat_id: [neighbor_ids]}
+        connectivity_dict: ConnectivityView {sat_id: [neighbor_ids]}
     """
     num_orbits = int(np.sqrt(num_satellites))
     sats_per_orbit = (num_satellites + num_orbits - 1) // num_orbits
@@ -22,39 +60,69 @@ def generate_synthetic_satellite_grid(num_satellites=100, lat_range = (30, 55),
     lats = np.linspace(lat_range[0], lat_range[1], sats_per_orbit)
     lons = np.linspace(lon_range[0], lon_range[1], num_orbits, endpoint=False)
 
-    satellite_positions = []
-    sat_id_map = {}      # (i, j) → sat_id
-    reverse_map = {}     # sat_id → (i, j)
-
-    sat_id = 0
-    for i, lon in enumerate(lons):
-        for j, lat in enumerate(lats):
-            if sat_id >= num_satellites:
-                break  # don’t exceed
-            satellite_positions.append((lat, lon))
-            sat_id_map[(i, j)] = sat_id
-            reverse_map[sat_id] = (i, j)
-            sat_id += 1
-
-    satellite_positions = np.array(satellite_positions)
-
-    connectivity = {}
-    for sid in range(num_satellites):
-        if sid not in reverse_map:
-            continue
-        i, j = reverse_map[sid]
-        neighbors = []
-
-        for di, dj in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            ni, nj = i + di, j + dj
-            neighbor_key = (ni % num_orbits, nj)
-            if neighbor_key in sat_id_map:
-                neighbors.append(sat_id_map[neighbor_key])
-
-        connectivity[sid] = neighbors
+    # sat_id = i * sats_per_orbit + j for orbit i and slot j
+    i, j = np.divmod(np.arange(num_satellites), sats_per_orbit)
+    satellite_positions = np.column_stack([lats[j], lons[i]])
 
+    # Neighbours in (-1, 0), (1, 0), (0, -1), (0, 1) order, wrapping in orbit only
+    ni = np.column_stack([(i - 1) % num_orbits, (i + 1) % num_orbits, i, i])
+    nj = np.column_stack([j, j, j - 1, j + 1])
+    candidates = ni * sats_per_orbit + nj
+    valid = (nj >= 0) & (nj < sats_per_orbit) & (candidates < num_satellites)
+
+    connectivity = _neighbors_to_csr(candidates, valid)
     return satellite_positions, connectivity
 
+
+def orbital_period_s(altitude_km):
+    """Circular-orbit period from Kepler's third law."""
+    return 2 * np.pi * np.sqrt((EARTH_RADIUS_KM + altitude_km) ** 3 / EARTH_MU)
+
+
+@phase("graph_build")
+def generate_constellation(shells, lon_offset=-180.0, time_s=0.0):
+    """
+    Generate a multi-shell Walker-style constellation with inclined planes.
+    Args:
+        shells: list of (num_orbits, sats_per_orbit, altitude_km, inclination_deg)
+        lon_offset: longitude of the first orbital plane's ascending node
+        time_s: seconds since epoch; satellites advance along their orbits
+            and the Earth rotates underneath them
+    Returns:
+        satellite_positions: np.array shape [N, 2] (lat, lon)
+        connectivity: ConnectivityView, four links per satellite (previous and
+            next slot in its plane, same slot in the neighbouring planes)
+        altitudes: np.array shape [N], km
+    Satellite ids are contiguous per shell, orbit-major within a shell.
+    """
+    positions, altitudes, candidates = [], [], []
+    offset = 0
+    for num_orbits, sats_per_orbit, altitude_km, inclination_deg in shells:
+        i, j = np.divmod(np.arange(num_orbits * sats_per_orbit), sats_per_orbit)
+        inclination = np.radians(inclination_deg)
+        arg_latitude = 2 * np.pi * ((j + 0.5 * (i % 2)) / sats_per_orbit + time_s / orbital_period_s(altitude_km))
+        raan = np.radians(lon_offset - EARTH_ROTATION_DEG_S * time_s) + 2 * np.pi * i / num_orbits
+
+        lat = np.degrees(np.arcsin(np.sin(inclination) * np.sin(arg_latitude)))
+        lon = np.arctan2(np.cos(inclination) * np.sin(arg_latitude), np.cos(arg_latitude)) + raan
+        lon = (np.degrees(lon) + 180.0) % 360.0 - 180.0
+        positions.append(np.column_stack([lat, lon]))
+        altitudes.append(np.full(i.size, float(altitude_km)))
+
+        ni = np.column_stack([(i - 1) % num_orbits, (i + 1) % num_orbits, i, i])
+        nj = np.column_stack([j, j, (j - 1) % sats_per_orbit, (j + 1) % sats_per_orbit])
+        candidates.append(offset + ni * sats_per_orbit + nj)
+        offset += i.size
+
+    candidates = np.concatenate(candidates)
+    own = np.arange(offset)[:, None]
+    valid = candidates != own
+    valid[:, 1] &= candidates[:, 1] != candidates[:, 0]
+    valid[:, 3] &= candidates[:, 3] != candidates[:, 2]
+
+    connectivity = _neighbors_to_csr(candidates, valid)
+    return np.concatenate(positions), connectivity, np.concatenate(altitudes)
+
 def plot_satellite_grid(satellite_positions):
     plt.figure(figsize=(12, 6))
     lats, lons = satellite_positions[:, 0], satellite_positions[:, 1]
@@ -0,0 +1,538 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology, pair_rhs_block
+from math_spatial_index import get_spatial_index
+from math_flow_results import FlowResults, FlowRoute
+from math_instrumentation import record_solve, relative_residual
+from math_jacobi import check_precision, solve_flow_jacobi_batched, solve_flow_jacobi_batched_mixed, topology_float32
+from math_direct import GroundedFactorization
+from math_greedy import shortest_path_trees, reconstruct_path
+from math_multigrid import infer_grid_shape
+from math_streaming import PAIR_SOLVERS
+from math_network_setup import generate_user_table
+
+BLOCK_SOLVERS = {}
+BATCH_ROUTERS = {}
+
+
+def register_block_solver(name):
+    """
+    Register a builder(topology, **options) that returns
+    solve_block(B) -> X for a block of right-hand sides B [N, P]. Builders
+    do their matrix-dependent setup once.
+    """
+    def decorator(builder):
+        BLOCK_SOLVERS[name] = builder
+        return builder
+    return decorator
+
+
+def register_batch_router(name):
+    """
+    Register a builder(topology, **options) that returns
+    route_batch(pairs) -> [route] for a list of (sat1, sat2) pairs in the
+    same component, for methods that do not route by potential flow.
+    """
+    def decorator(builder):
+        BATCH_ROUTERS[name] = builder
+        return builder
+    return decorator
+
+
+@register_block_solver("jacobi")
+def jacobi_block_solver(topology, max_iter=100, tol=1e-4, precision="float64"):
+    check_precision(precision)
+    A = topology.system_matrix()[0]
+    if precision == "mixed":
+        A32 = topology_float32(topology)
+        return lambda B: solve_flow_jacobi_batched_mixed(A, B, max_iter=max_iter, tol=tol, A32=A32)[0]
+    return lambda B: solve_flow_jacobi_batched(A, B, max_iter=max_iter, tol=tol)[0]
+
+
+@register_block_solver("direct")
+def direct_block_solver(topology):
+    A = topology.system_matrix()[0]
+    factorization = GroundedFactorization(A)
+
+    def solve_block(B):
+        start = time.perf_counter()
+        X = factorization.solve(B)
+        record_solve("direct", 0, relative_residual(B - A @ X, B), True, start)
+        return X
+    return solve_block
+
+
+def block_solver(topology, method, **options):
+    """
+    Build solve_block(B) -> X for a flow method. Methods without a batched
+    solver fall back to their PAIR_SOLVERS entry, one column at a time.
+    """
+    if method in BLOCK_SOLVERS:
+        return BLOCK_SOLVERS[method](topology, **options)
+    solve = PAIR_SOLVERS[method](topology, **options)
+    return lambda B: np.column_stack([solve(b)[0] for b in B.T]) if B.shape[1] else np.zeros(B.shape)
+
+
+@register_batch_router("dijkstra")
+def dijkstra_batch_router(topology):
+    def route_batch(pairs):
+        distances, predecessors, row_map = shortest_path_trees(topology, {sat1 for sat1, _ in pairs})
+        return [{"latency": float(distances[row_map[sat1], sat2]),
+                 "path": reconstruct_path(predecessors[row_map[sat1]], sat1, sat2)} for sat1, sat2 in pairs]
+    return route_batch
+
+
+def batch_router(topology, method, **options):
+    """
+    Build route_batch(pairs) -> [route] for any method. Routes are
+    {"latency", "path"} mappings for BATCH_ROUTERS methods and
+    {"flow", "total_flow"} mappings from a block solve otherwise.
+    """
+    if method in BATCH_ROUTERS:
+        return BATCH_ROUTERS[method](topology, **options)
+    solve_block = block_solver(topology, method, **options)
+    _, idx_map, nodes = topology.system_matrix()
+
+    def route_batch(pairs):
+        results = FlowResults(nodes, idx_map, len(pairs))
+        return [FlowRoute(results, slot) for slot in results.store_block(solve_block(pair_rhs_block(len(nodes), pairs, idx_map)))]
+    return route_batch
+
+
+def latency_percentiles(samples, percentiles=(50, 90, 99)):
+    """{"p50_ms": ..., "max_ms": ...} for latency samples in seconds."""
+    if not len(samples):
+        return {}
+    samples_ms = np.asarray(samples) * 1e3
+    summary = {f"p{p}_ms": float(v) for p, v in zip(percentiles, np.percentile(samples_ms, percentiles))}
+    summary["max_ms"] = float(samples_ms.max())
+    return summary
+
+
+class _Request:
+    __slots__ = ("request_id", "source", "target", "flow_threshold", "arrival", "deadline", "future")
+
+    def __init__(self, request_id, source, target, flow_threshold, arrival, deadline, future):
+        self.request_id = request_id
+        self.source = source
+        self.target = target
+        self.flow_threshold = flow_threshold
+        self.arrival = arrival
+        self.deadline = deadline
+        self.future = future
+
+
+class RoutingService:
+    """
+    Long-running router for individual "route location A to location B"
+    requests against one precomputed constellation.
+
+    Requests are queued and a single batcher task takes whatever arrives
+    within batch_window seconds of the first one (at most max_batch),
+    assigns every endpoint to its nearest satellite in one spatial-index
+    query, drops duplicate satellite pairs (either direction) and solves the
+    rest with one batched solve in a worker thread, so the event loop keeps
+    accepting requests meanwhile.
+
+    The queue holds at most max_pending requests. When it is full, new
+    requests either wait for room (overload="wait", which stops reading
+    from that connection and pushes back on the client through the socket)
+    or are answered "overloaded" at once (overload="reject"). A request
+    whose deadline passes before its batch is solved, or before the solve
+    finishes, is answered "deadline_exceeded" instead of late.
+
+    Protocol: one JSON object per line in each direction. Requests are
+        {"id": 7, "source": [lat, lon], "target": [lat, lon],
+         "deadline_ms": 50, "flow_threshold": 0.01}
+    (deadline_ms and flow_threshold optional) or {"id": 8, "op": "stats"}.
+    Responses carry the same id, may arrive out of order, and have a status
+    of "ok", "unreachable", "deadline_exceeded", "overloaded" or "error".
+    """
+
+    def __init__(self, topology, satellite_positions, method="direct", batch_window=0.002, max_batch=256,
+                 max_pending=4096, overload="wait", default_deadline=None, latency_window=100000,
+                 **solver_options):
+        if overload not in ("wait", "reject"):
+            raise ValueError(f"overload must be 'wait' or 'reject', got {overload!r}")
+        self.topology = topology
+        self.method = method
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.overload = overload
+        self.default_deadline = default_deadline
+        self.index = get_spatial_index(satellite_positions)
+        self.route_batch = batch_router(topology, method, **solver_options)
+
+        self.counts = {status: 0 for status in ("ok", "unreachable", "deadline_exceeded", "overloaded", "error")}
+        self.batches = 0
+        self.solved_pairs = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.batch_sizes = deque(maxlen=latency_window)
+        self._queue = None
+        self._batcher = None
+        self._executor = None
+        self._in_flight = []
+
+    async def start(self):
+        if self._batcher is None:
+            self._queue = asyncio.Queue(self.max_pending)
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="routing-solve")
+            self._batcher = asyncio.create_task(self._batch_loop())
+
+    async def close(self):
+        if self._batcher is None:
+            return
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+        # Requests the batcher had already taken off the queue, then those still queued
+        pending = self._in_flight
+        self._in_flight = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for request in pending:
+            if not request.future.done():
+                self._finish(request, {"status": "error", "error": "service closed"})
+        self._executor.shutdown(wait=True)
+        self._batcher = None
+
+    async def route(self, source, target, deadline=None, flow_threshold=None, request_id=None):
+        """Route one request in-process. deadline is in seconds from now."""
+        future = await self._enqueue(request_id, source, target, deadline, flow_threshold)
+        return await future
+
+    async def _enqueue(self, request_id, source, target, deadline, flow_threshold):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if deadline is None:
+            deadline = self.default_deadline
+        request = _Request(request_id, (float(source[0]), float(source[1])), (float(target[0]), float(target[1])),
+                           flow_threshold, now, None if deadline is None else now + deadline, loop.create_future())
+        if self.overload == "reject" and self._queue.full():
+            self._finish(request, {"status": "overloaded"})
+        else:
+            await self._queue.put(request)
+        return request.future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._in_flight = [await self._queue.get()]
+            if self.batch_window > 0 and self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.batch_window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            live = []
+            now = loop.time()
+            for request in batch:
+                if request.deadline is not None and now > request.deadline:
+                    self._finish(request, {"status": "deadline_exceeded"})
+                else:
+                    live.append(request)
+            if not live:
+                self._in_flight = []
+                continue
+
+            try:
+                bodies, num_pairs = await loop.run_in_executor(self._executor, self._solve, live)
+                self.solved_pairs += num_pairs
+            except Exception as exc:
+                bodies = [{"status": "error", "error": f"{type(exc).__name__}: {exc}"}] * len(live)
+            now = loop.time()
+            for request, body in zip(live, bodies):
+                if request.deadline is not None and now > request.deadline:
+                    body = {"status": "deadline_exceeded"}
+                self._finish(request, body)
+            self._in_flight = []
+            self.batches += 1
+            self.batch_sizes.append(len(live))
+
+    def _solve(self, requests):
+        """
+        Route one batch (runs in the worker thread, so it only reads service
+        state). Returns a response body per request and the number of
+        distinct satellite pairs solved.
+        """
+        points = np.array([request.source + request.target for request in requests])
+        sat1 = self.index.nearest(points[:, 0], points[:, 1])
+        sat2 = self.index.nearest(points[:, 2], points[:, 3])
+        lo, hi = np.minimum(sat1, sat2), np.maximum(sat1, sat2)
+        reachable = self.topology.labels[lo] == self.topology.labels[hi]
+
+        pairs, inverse = np.unique(np.column_stack([lo, hi])[reachable], axis=0, return_inverse=True)
+        routes = self.route_batch([tuple(pair) for pair in pairs.tolist()]) if len(pairs) else []
+
+        bodies = []
+        slots = iter(inverse.reshape(-1).tolist())
+        for request, s1, s2, ok in zip(requests, sat1.tolist(), sat2.tolist(), reachable.tolist()):
+            body = {"sat1": s1, "sat2": s2}
+            if not ok:
+                body["status"] = "unreachable"
+            else:
+                body["status"] = "ok"
+                body.update(self._route_body(routes[next(slots)], flipped=s1 > s2,
+                                             flow_threshold=request.flow_threshold))
+            bodies.append(body)
+        return bodies, len(pairs)
+
+    def _route_body(self, route, flipped, flow_threshold):
+        if "latency" in route:
+            path = route["path"]
+            return {"latency": route["latency"], "path": path[::-1] if flipped else path}
+        body = {"total_flow": route["total_flow"]}
+        if flow_threshold is not None:
+            x = route["flow"].to_array()
+            if flipped:
+                x = -x
+            positions = np.flatnonzero(np.abs(x) > flow_threshold)
+            nodes = self.topology.nodes
+            body["flow"] = {str(nodes[i]): float(x[i]) for i in positions.tolist()}
+        return body
+
+    def _finish(self, request, body):
+        self.counts[body["status"]] += 1
+        body["id"] = request.request_id
+        body["service_ms"] = (asyncio.get_running_loop().time() - request.arrival) * 1e3
+        if body["status"] != "overloaded":
+            self.latencies.append(body["service_ms"] / 1e3)
+        if not request.future.done():
+            request.future.set_result(body)
+
+    def stats(self):
+        """Request counts by status, batching and service-side latency percentiles."""
+        return {
+            "method": self.method,
+            "counts": dict(self.counts),
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            "solved_pairs": self.solved_pairs,
+            "latency": latency_percentiles(self.latencies),
+        }
+
+    async def handle_connection(self, reader, writer):
+        write_lock = asyncio.Lock()
+        replies = set()
+
+        async def send(body):
+            async with write_lock:
+                writer.write(json.dumps(body).encode() + b"\n")
+                await writer.drain()
+
+        async def reply(future):
+            await send(await future)
+
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                    request_id = message.get("id")
+                    if message.get("op", "route") == "stats":
+                        await send(dict(self.stats(), id=request_id, status="ok"))
+                        continue
+                    deadline_ms = message.get("deadline_ms")
+                    future = await self._enqueue(request_id, message["source"], message["target"],
+                                                 None if deadline_ms is None else deadline_ms / 1e3,
+                                                 message.get("flow_threshold"))
+                except (ValueError, KeyError, TypeError, AttributeError, IndexError) as exc:
+                    await send({"id": None, "status": "error", "error": f"bad request: {exc}"})
+                    continue
+                task = asyncio.create_task(reply(future))
+                replies.add(task)
+                task.add_done_callback(replies.discard)
+            if replies:
+                await asyncio.gather(*replies)
+        except ConnectionError:
+            pass
+        finally:
+            for task in replies:
+                task.cancel()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve(self, path=None, host="127.0.0.1", port=0):
+        """Start listening on a Unix socket at path, or on host:port. Returns the asyncio server."""
+        await self.start()
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle_connection, path=path)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+class RoutingClient:
+    """
+    Pipelining client for RoutingService: any number of requests may be in
+    flight on one connection, and replies are matched back by id.
+    """
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._pending = {}
+        self._next_id = 0
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    @classmethod
+    async def connect(cls, path=None, host="127.0.0.1", port=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _read_loop(self):
+        try:
+            while line := await self._reader.readline():
+                message = json.loads(line)
+                future = self._pending.pop(message.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("routing service closed the connection"))
+            self._pending.clear()
+
+    async def _request(self, message):
+        self._next_id += 1
+        message["id"] = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        self._writer.write(json.dumps(message).encode() + b"\n")
+        await self._writer.drain()
+        return await future
+
+    async def route(self, source, target, deadline_ms=None, flow_threshold=None):
+        message = {"source": list(source), "target": list(target)}
+        if deadline_ms is not None:
+            message["deadline_ms"] = deadline_ms
+        if flow_threshold is not None:
+            message["flow_threshold"] = flow_threshold
+        return await self._request(message)
+
+    async def stats(self):
+        return await self._request({"op": "stats"})
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self._read_task
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+async def run_load(client, num_requests, concurrency=64, deadline_ms=None, seed=0):
+    """
+    Send num_requests routes between random user locations with at most
+    concurrency in flight. Returns status counts, throughput and
+    client-side latency percentiles.
+    """
+    table = generate_user_table(1, 2 * num_requests, seed=seed)
+    lats, lons = table.get_locations()
+    points = np.column_stack([lats, lons]).reshape(num_requests, 2, 2).tolist()
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    counts = {}
+
+    async def one(source, target):
+        async with slots:
+            start = time.perf_counter()
+            response = await client.route(source, target, deadline_ms=deadline_ms)
+            latencies.append(time.perf_counter() - start)
+            counts[response["status"]] = counts.get(response["status"], 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(source, target) for source, target in points))
+    elapsed = time.perf_counter() - start
+    return {"requests": num_requests, "seconds": elapsed, "requests_per_s": num_requests / elapsed,
+            "counts": counts, "latency": latency_percentiles(latencies)}
+
+
+async def _serve_forever(service, args):
+    server = await service.serve(path=args.unix, host=args.host, port=args.port)
+    print(f"Routing service ({args.method}) listening on "
+          f"{args.unix or ':'.join(map(str, server.sockets[0].getsockname()[:2]))}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+async def _demo(service, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.unix or (os.path.join(tmp, "routing.sock") if hasattr(asyncio, "start_unix_server") else None)
+        server = await service.serve(path=path, host=args.host, port=args.port)
+        port = None if path else server.sockets[0].getsockname()[1]
+        async with server:
+            async with await RoutingClient.connect(path, host=args.host, port=port) as client:
+                load = await run_load(client, args.requests, concurrency=args.concurrency,
+                                      deadline_ms=args.deadline_ms, seed=args.seed)
+                stats = await client.stats()
+        await service.close()
+
+    print(f"{load['requests']} requests in {load['seconds']:.2f}s ({load['requests_per_s']:.0f} req/s), "
+          f"statuses {load['counts']}")
+    print("client latency:  " + ", ".join(f"{k} {v:.2f}" for k, v in load["latency"].items()))
+    print("service latency: " + ", ".join(f"{k} {v:.2f}" for k, v in stats["latency"].items()))
+    print(f"{stats['batches']} batches, mean batch size {stats['mean_batch_size']:.1f}, "
+          f"{stats['solved_pairs']} distinct satellite pairs solved")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve satellite routing requests over a socket.")
+    parser.add_argument("--satellites", type=int, default=400)
+    parser.add_argument("--method", default="direct", choices=sorted(set(BATCH_ROUTERS) | set(BLOCK_SOLVERS) | set(PAIR_SOLVERS)))
+    parser.add_argument("--window-ms", type=float, default=2.0, help="micro-batching window")
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-pending", type=int, default=4096)
+    parser.add_argument("--overload", choices=("wait", "reject"), default="wait")
+    parser.add_argument("--deadline-ms", type=float, help="per-request deadline")
+    parser.add_argument("--unix", help="Unix socket path (default: TCP)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--serve", action="store_true", help="serve until interrupted instead of running the demo load")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    satellite_positions, connectivity = generate_synthetic_satellite_grid(args.satellites)
+    topology = build_topology(satellite_positions, connectivity)
+    solver_options = {}
+    if args.method == "multigrid":
+        solver_options["grid_shape"] = infer_grid_shape(satellite_positions, connectivity)
+    service = RoutingService(topology, satellite_positions, method=args.method, batch_window=args.window_ms / 1e3,
+                             max_batch=args.max_batch, max_pending=args.max_pending, overload=args.overload,
+                             **solver_options)
+    try:
+        asyncio.run(_serve_forever(service, args) if args.serve else _demo(service, args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,28 @@
 import numpy as np
-from math_users_information import k_center
+from math_users_information import k_center, user_ids, user_locations
+from math_spatial_index import great_circle_distance
 
 class SESSION:
-    def __init__(self, session_id):
+    """
+    A session's users, either as a list of USER or backed by a UserTable
+    slice. Table-backed sessions build their USER objects on the first
+    get_user() call; k-center assignment reads the table columns directly.
+    """
+    __slots__ = ("id", "user", "table", "user_satellite_map")
+
+    def __init__(self, session_id, table=None):
         self.id = session_id
-        self.user = []
+        self.user = None if table is not None else []
+        self.table = table
         self.user_satellite_map = {}  # Map user_id -> satellite_id
 
     def get_user(self):
+        if self.user is None:
+            self.user = self.table.to_users()
         return self.user
 
     def add_user(self, to_add):
-        self.user.append(to_add)
+        self.get_user().append(to_add)
 
     def assign_k_center_satellites(self, satellite_positions, k):
         """
@@ -22,13 +33,14 @@ class SESSION:
             k (int): number of candidate satellites (from k-center)
         """
         self.user_satellite_map = {}
-        k_satellite_indices = k_center(self.user, satellite_positions, k)
+        users = self.table if self.user is None else self.user
+        if not len(users):
+            return
+        k_satellite_indices = k_center(users, satellite_positions, k)
         k_sat_positions = satellite_positions[k_satellite_indices]
 
-        for user in self.user:
-            user_lat, user_lon = user.get_location()
-            distances = np.sqrt((k_sat_positions[:, 0] - user_lat) ** 2 +
-                                (k_sat_positions[:, 1] - user_lon) ** 2)
-            closest_idx = np.argmin(distances)
-            closest_sat_id = k_satellite_indices[closest_idx]
-            self.user_satellite_map[user.get_id()] = closest_sat_id
+        lats, lons = user_locations(users)
+        distances = great_circle_distance(lats[:, None], lons[:, None],
+                                          k_sat_positions[None, :, 0], k_sat_positions[None, :, 1])
+        closest = np.asarray(k_satellite_indices)[np.argmin(distances, axis=1)]
+        self.user_satellite_map = dict(zip(user_ids(users).tolist(), closest.tolist()))
@@ -0,0 +1,74 @@
+import hashlib
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def latlon_to_unit_xyz(lat, lon):
+    """Map lat/lon in degrees to points on the unit sphere, shape [..., 3]."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def great_circle_distance(lat1, lon1, lat2, lon2, radius_km=EARTH_RADIUS_KM):
+    """Haversine distance in km; arguments broadcast like NumPy arrays."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * radius_km * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def chord_to_great_circle(chord, radius_km=EARTH_RADIUS_KM):
+    """Convert unit-sphere chord length to great-circle distance in km."""
+    return 2 * radius_km * np.arcsin(np.clip(chord / 2, 0.0, 1.0))
+
+
+class SatelliteSpatialIndex:
+    """
+    KD-tree over satellite positions embedded on the unit sphere.
+
+    Euclidean order of chord lengths equals great-circle order, so nearest
+    and k-nearest queries are exact on the sphere and wrap correctly across
+    the antimeridian.
+    """
+
+    def __init__(self, satellite_positions):
+        self.satellite_positions = np.asarray(satellite_positions)
+        self.tree = cKDTree(latlon_to_unit_xyz(self.satellite_positions[:, 0], self.satellite_positions[:, 1]))
+
+    def k_nearest(self, lats, lons, k=1):
+        """
+        Args:
+            lats, lons: array-like of query points in degrees, shape [M]
+            k: number of satellites per query
+        Returns:
+            indices: np.ndarray shape [M, k] (or [M] when k == 1)
+            distances_km: np.ndarray with the same shape
+        """
+        k = min(k, len(self.satellite_positions))
+        chord, indices = self.tree.query(latlon_to_unit_xyz(np.asarray(lats), np.asarray(lons)), k=k, workers=-1)
+        return indices, chord_to_great_circle(chord)
+
+    def nearest(self, lats, lons):
+        indices, _ = self.k_nearest(lats, lons, k=1)
+        return indices
+
+
+_index_cache = {}
+
+
+def get_spatial_index(satellite_positions, max_cached=4):
+    """
+    Return a spatial index for these positions, rebuilding it only when the
+    constellation (the position array contents) changes.
+    """
+    positions = np.ascontiguousarray(satellite_positions)
+    key = (positions.shape, hashlib.blake2b(positions.tobytes(), digest_size=16).hexdigest())
+    index = _index_cache.pop(key, None)
+    if index is None:
+        index = SatelliteSpatialIndex(positions)
+    _index_cache[key] = index
+    while len(_index_cache) > max_cached:
+        _index_cache.pop(next(iter(_index_cache)))
+    return index
@@ -0,0 +1,274 @@
+import json
+import math
+import os
+import time
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology, pair_rhs
+from math_flow_results import FlowVector
+from math_instrumentation import record_solve, relative_residual
+from math_jacobi import check_precision, solve_potential_jacobi, solve_potential_jacobi_mixed, topology_float32
+from math_gauss_seidel import multicolor_ordering, multicolor_sweeps, solve_potential_gauss_seidel
+from math_direct import GroundedFactorization
+from math_conjugate_gradient import PRECONDITIONERS, solve_potential_cg
+from math_multigrid import MultigridHierarchy, infer_grid_shape, solve_potential_multigrid
+from math_greedy import LazyRoute
+from math_network_setup import generate_sessions, assign_users_to_closest_satellites
+
+PAIR_SOLVERS = {}
+
+
+def register_pair_solver(name):
+    """
+    Register a builder(topology, **options) that returns
+    solve(b) -> (x, SolveStats) for one right-hand side. Builders do their
+    matrix-dependent setup once.
+    """
+    def decorator(builder):
+        PAIR_SOLVERS[name] = builder
+        return builder
+    return decorator
+
+
+@register_pair_solver("jacobi")
+def jacobi_pair_solver(topology, max_iter=100, tol=1e-4, precision="float64"):
+    check_precision(precision)
+    A = topology.system_matrix()[0]
+    if precision == "mixed":
+        A32 = topology_float32(topology)
+        return lambda b: solve_potential_jacobi_mixed(A, b, max_iter=max_iter, tol=tol, A32=A32)
+    return lambda b: solve_potential_jacobi(A, b, max_iter=max_iter, tol=tol)
+
+
+@register_pair_solver("gauss_seidel")
+def gauss_seidel_pair_solver(topology, omega=1.0, max_iter=100, tol=1e-4):
+    A = topology.system_matrix()[0]
+    sweeps = multicolor_sweeps(A, multicolor_ordering(A))
+    return lambda b: solve_potential_gauss_seidel(sweeps, b, omega=omega, max_iter=max_iter, tol=tol)
+
+
+@register_pair_solver("direct")
+def direct_pair_solver(topology):
+    A = topology.system_matrix()[0]
+    factorization = GroundedFactorization(A)
+
+    def solve(b):
+        start = time.perf_counter()
+        x = factorization.solve(b)
+        return x, record_solve("direct", 0, relative_residual(b - A @ x, b), True, start)
+    return solve
+
+
+@register_pair_solver("cg")
+def cg_pair_solver(topology, preconditioner="jacobi", max_iter=None, tol=1e-6):
+    A = topology.system_matrix()[0]
+    apply_preconditioner = PRECONDITIONERS[preconditioner](A)
+    return lambda b: solve_potential_cg(A, b, apply_preconditioner, topology.labels, max_iter=max_iter, tol=tol)
+
+
+@register_pair_solver("multigrid")
+def multigrid_pair_solver(topology, grid_shape=None, cycle="V", smoother="gauss_seidel", max_iter=50, tol=1e-6):
+    A = topology.system_matrix()[0]
+    hierarchy = MultigridHierarchy(A, grid_shape=grid_shape, smoother=smoother)
+    return lambda b: solve_potential_multigrid(hierarchy, b, cycle=cycle, max_iter=max_iter, tol=tol)
+
+
+def iter_user_pairs(users, user_to_satellite, order="input"):
+    """
+    Yield (uid1, uid2, sat1, sat2) for every pair in combinations(users, 2)
+    without materializing the pair list.
+    Args:
+        order: "input" for combinations order, or "source" to group pairs by
+            the first user's satellite (each pair keeps its (uid1, uid2)
+            orientation, so results stay keyed as in the batch routers)
+    """
+    uids = [user.get_id() for user in users]
+    sats = [user_to_satellite[uid] for uid in uids]
+    if order == "input":
+        rows = range(len(uids))
+    elif order == "source":
+        rows = sorted(range(len(uids)), key=lambda i: sats[i])
+    else:
+        raise ValueError(f"unknown pair order {order!r}")
+
+    for i in rows:
+        for j in range(i + 1, len(uids)):
+            yield uids[i], uids[j], sats[i], sats[j]
+
+
+def stream_satellite_routes(users, user_to_satellite, satellite_positions, connectivity, method="jacobi",
+                            order="input", topology=None, **solver_options):
+    """
+    Generator counterpart of compute_satellite_routes_*: yields
+    (uid1, uid2, result) as each pair is solved. Only the current pair's
+    potential (or the current source's shortest-path tree for "dijkstra")
+    is held, so memory does not grow with the number of users.
+
+    Flow methods yield {"flow": FlowVector, "total_flow"}; "dijkstra"
+    yields {"latency", "path"}. Unreachable pairs use the same sentinels as
+    the batch routers.
+    """
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    pairs = iter_user_pairs(users, user_to_satellite, order=order)
+
+    if method == "dijkstra":
+        W = topology.weighted_adjacency()
+        tree_source, distances, predecessors = None, None, None
+        for uid1, uid2, sat1, sat2 in pairs:
+            if not topology.connected(sat1, sat2):
+                yield uid1, uid2, {"latency": float("inf"), "path": None}
+                continue
+            if sat1 != tree_source:
+                tree_source = sat1
+                distances, predecessors = dijkstra(W, directed=False, indices=sat1, return_predecessors=True)
+            yield uid1, uid2, LazyRoute(float(distances[sat2]), predecessors, sat1, sat2)
+        return
+
+    if method == "multigrid" and connectivity is not None:
+        solver_options.setdefault("grid_shape", infer_grid_shape(satellite_positions, connectivity))
+    A, idx_map, nodes = topology.system_matrix()
+    solve = PAIR_SOLVERS[method](topology, **solver_options)
+    for uid1, uid2, sat1, sat2 in pairs:
+        if not topology.connected(sat1, sat2):
+            yield uid1, uid2, {"flow": None, "total_flow": float("inf")}
+            continue
+        b = pair_rhs(len(nodes), sat1, sat2, idx_map)
+        x, _ = solve(b)
+        yield uid1, uid2, {"flow": FlowVector(nodes, idx_map, x), "total_flow": float(np.abs(x).sum())}
+
+
+def _json_number(value):
+    """value as a float, or None (JSON null) when it is None, inf or NaN."""
+    if value is None:
+        return None
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _record_to_json(uid1, uid2, result, flow_threshold):
+    record = {"uid1": uid1, "uid2": uid2}
+    if "latency" in result:
+        record["latency"] = _json_number(result["latency"])
+        record["path"] = result["path"]
+        return record
+    record["total_flow"] = _json_number(result["total_flow"])
+    if flow_threshold is not None and result["flow"] is not None:
+        record["flow"] = {str(node): _json_number(f) for node, f in result["flow"].items()
+                          if abs(f) > flow_threshold}
+    return record
+
+
+def write_jsonl(records, path, flow_threshold=None):
+    """
+    Write streamed (uid1, uid2, result) records as one JSON object per line.
+    Flows are omitted unless flow_threshold is given, in which case only
+    nodes with |flow| above it are written. Infinite or NaN values (e.g. the
+    latency of an unreachable pair) are written as null, so every line is
+    strict JSON. Returns the number of records.
+    """
+    count = 0
+    with open(path, "w") as f:
+        for uid1, uid2, result in records:
+            record = _record_to_json(uid1, uid2, result, flow_threshold)
+            f.write(json.dumps(record, allow_nan=False) + "\n")
+            count += 1
+    return count
+
+
+class ColumnarWriter:
+    """
+    Append-only columnar sink: one raw binary file per column in a
+    directory, plus schema.json with dtypes and the row count. Rows are
+    buffered and flushed every batch_size records. read_columnar() maps the
+    columns back as np.memmap arrays.
+    """
+
+    def __init__(self, path, columns, batch_size=4096):
+        """columns: {name: dtype}"""
+        self.path = path
+        self.columns = {name: np.dtype(dtype) for name, dtype in columns.items()}
+        self.batch_size = batch_size
+        self.num_rows = 0
+        self._buffer = {name: [] for name in self.columns}
+        os.makedirs(path, exist_ok=True)
+        for name in self.columns:
+            open(os.path.join(path, f"{name}.bin"), "wb").close()
+
+    def append(self, **row):
+        for name in self.columns:
+            self._buffer[name].append(row[name])
+        if len(self._buffer[next(iter(self.columns))]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        count = len(self._buffer[next(iter(self.columns))])
+        if not count:
+            return
+        for name, dtype in self.columns.items():
+            with open(os.path.join(self.path, f"{name}.bin"), "ab") as f:
+                np.asarray(self._buffer[name], dtype=dtype).tofile(f)
+            self._buffer[name] = []
+        self.num_rows += count
+
+    def close(self):
+        self.flush()
+        schema = {"num_rows": self.num_rows, "columns": {name: dtype.str for name, dtype in self.columns.items()}}
+        with open(os.path.join(self.path, "schema.json"), "w") as f:
+            json.dump(schema, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_columnar(records, path, batch_size=4096):
+    """
+    Write streamed records as columns uid1, uid2 and metric (total_flow for
+    flow methods, latency for "dijkstra"). Returns the number of records.
+    """
+    columns = {"uid1": np.int64, "uid2": np.int64, "metric": np.float64}
+    with ColumnarWriter(path, columns, batch_size=batch_size) as writer:
+        for uid1, uid2, result in records:
+            metric = result["latency"] if "latency" in result else result["total_flow"]
+            writer.append(uid1=uid1, uid2=uid2, metric=metric)
+    return writer.num_rows
+
+
+def read_columnar(path):
+    """Open a ColumnarWriter directory as {column: np.memmap}."""
+    with open(os.path.join(path, "schema.json")) as f:
+        schema = json.load(f)
+    if not schema["num_rows"]:
+        return {name: np.zeros(0, dtype=np.dtype(dtype)) for name, dtype in schema["columns"].items()}
+    return {name: np.memmap(os.path.join(path, f"{name}.bin"), dtype=np.dtype(dtype), mode="r",
+                            shape=(schema["num_rows"],))
+            for name, dtype in schema["columns"].items()}
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    num_satellites = 100
+    users_per_session = 40
+
+    satellite_positions, connectivity = generate_synthetic_satellite_grid(
+        num_satellites, lat_range=(30, 55), lon_range=(-140, 160))
+    users = generate_sessions(1, users_per_session)[0].get_user()
+    user_to_satellite_map = assign_users_to_closest_satellites(users, satellite_positions)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        records = stream_satellite_routes(users, user_to_satellite_map, satellite_positions, connectivity,
+                                          method="dijkstra", order="source")
+        count = write_jsonl(records, os.path.join(out_dir, "routes.jsonl"))
+        print(f"Wrote {count} Dijkstra routes as JSONL")
+
+        records = stream_satellite_routes(users, user_to_satellite_map, satellite_positions, connectivity,
+                                          method="direct")
+        count = write_columnar(records, os.path.join(out_dir, "flows"))
+        columns = read_columnar(os.path.join(out_dir, "flows"))
+        reachable = np.isfinite(columns["metric"])
+        print(f"Wrote {count} direct-solver flows; mean total flow {columns['metric'][reachable].mean():.2f}")
@@ -0,0 +1,100 @@
+import numpy as np
+from itertools import combinations
+from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology
+from math_direct import GroundedFactorization
+from math_flow_results import FlowResults
+from math_instrumentation import phase
+from math_network_setup import (
+    generate_sessions,
+    assign_users_to_closest_satellites,
+    plot_colored_user_satellite_graph,
+    print_user_satellite_pairs,
+    print_satellite_connectivity
+)
+
+
+def solve_satellite_potentials(factorization, idx_map, satellites):
+    """
+    Solve once per distinct satellite for its unit-injection potential.
+
+    Satellite s injects one unit of flow that is drained uniformly over its
+    connected component, so the right-hand side is consistent with the
+    singular Laplacian. For any s, t in the same component the drains cancel,
+    and phi_s - phi_t is the solution for the pair right-hand side e_s - e_t.
+
+    Args:
+        factorization: GroundedFactorization of the system matrix
+        idx_map: {node: matrix index}
+        satellites: iterable of distinct satellite ids
+    Returns:
+        potentials: np.ndarray shape [N, S], one column per satellite
+        column_map: {sat_id: column index}
+    """
+    satellites = list(satellites)
+    column_map = {sat: k for k, sat in enumerate(satellites)}
+    rows = np.array([idx_map[sat] for sat in satellites], dtype=int)
+
+    B = np.zeros((factorization.N, len(satellites)))
+    B[rows, np.arange(len(satellites))] = 1
+    drain = 1.0 / factorization.component_sizes[factorization.labels[rows]]
+    B -= (factorization.labels[:, None] == factorization.labels[rows][None, :]) * drain
+
+    potentials = factorization.solve(B)
+    return potentials, column_map
+
+
+@phase("solve")
+def compute_satellite_routes_superposition(users, user_to_satellite, satellite_positions, connectivity,
+                                           topology=None, flow_dtype=np.float64, flow_threshold=None):
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    A, idx_map, nodes = topology.system_matrix()
+    factorization = GroundedFactorization(A)
+
+    occupied = sorted({user_to_satellite[user.get_id()] for user in users})
+    potentials, column_map = solve_satellite_potentials(factorization, idx_map, occupied)
+    num_pairs = len(users) * (len(users) - 1) // 2
+    results = FlowResults(nodes, idx_map, num_pairs, dtype=flow_dtype, threshold=flow_threshold)
+
+    for user1, user2 in combinations(users, 2):
+        uid1, uid2 = user1.get_id(), user2.get_id()
+        sat1, sat2 = user_to_satellite[uid1], user_to_satellite[uid2]
+
+        if topology.connected(sat1, sat2):
+            x = potentials[:, column_map[sat1]] - potentials[:, column_map[sat2]]
+            results.add((uid1, uid2), x)
+        else:
+            results.add((uid1, uid2), None)
+    return results
+
+
+if __name__ == "__main__":
+    num_satellites = 50
+    num_sessions = 1
+    users_per_session = 10
+
+    satellite_positions, connectivity = generate_synthetic_satellite_grid(
+        num_satellites, lat_range=(30, 55), lon_range=(-140, 160))
+
+    sessions = generate_sessions(num_sessions, users_per_session)
+    session = sessions[0]
+    users = session.get_user()
+
+    user_to_satellite_map = assign_users_to_closest_satellites(users, satellite_positions)
+    print_user_satellite_pairs(users, user_to_satellite_map)
+    print_satellite_connectivity(connectivity)
+
+    print("\nUser Pair Routing via Superposition of Per-Satellite Potentials:")
+    results = compute_satellite_routes_superposition(users, user_to_satellite_map, satellite_positions, connectivity)
+
+    for (u1, u2), data in results.items():
+        flow = data["flow"]
+        if flow is not None:
+            significant = {s: f for s, f in flow.items() if abs(f) > 0.01}
+            print(f"User {u1} <-> User {u2}: Flow Path = [" + ", ".join(
+                f"S{s}:{f:.2f}" for s, f in significant.items()) + "]")
+        else:
+            print(f"User {u1} <-> User {u2}: No valid flow path")
+
+    plot_colored_user_satellite_graph(session.get_user(), satellite_positions, user_to_satellite_map)
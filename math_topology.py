@@ -0,0 +1,246 @@
+import numpy as np
+from itertools import chain
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import connected_components
+from math_satellites import calculate_latency
+from math_reachability import ReachabilityIndex
+from math_instrumentation import phase
+
+
+def connectivity_to_edges(connectivity, num_nodes=None):
+    """
+    Flatten a connectivity mapping {sat_id: [neighbor_ids]} into undirected
+    edge arrays with u < v, no self loops and no duplicates.
+    Args:
+        connectivity: dict-like {sat_id: [neighbor_ids]}, or any object with
+            CSR `indptr` / `indices` neighbour arrays
+        num_nodes: number of satellites, inferred from the ids when None
+    Returns:
+        edge_u, edge_v: np.ndarray int32 shape [E]
+        num_nodes: int
+    """
+    if hasattr(connectivity, "indptr") and hasattr(connectivity, "indices"):
+        indptr = np.asarray(connectivity.indptr)
+        src = np.repeat(np.arange(indptr.size - 1), np.diff(indptr))
+        dst = np.asarray(connectivity.indices)
+    else:
+        keys = list(connectivity.keys())
+        counts = np.fromiter((len(connectivity[k]) for k in keys), dtype=np.int64, count=len(keys))
+        src = np.repeat(np.asarray(keys, dtype=np.int64), counts)
+        dst = np.fromiter(chain.from_iterable(connectivity[k] for k in keys), dtype=np.int64,
+                          count=int(counts.sum()))
+
+    if num_nodes is None:
+        num_nodes = int(max(src.max(initial=-1), dst.max(initial=-1))) + 1
+
+    keep = src != dst
+    u = np.minimum(src[keep], dst[keep])
+    v = np.maximum(src[keep], dst[keep])
+    # COO -> CSR sorts and merges duplicate (u, v) entries in compiled code
+    upper = coo_matrix((np.ones(u.size, dtype=np.int8), (u, v)), shape=(num_nodes, num_nodes)).tocsr()
+    upper.sum_duplicates()
+    edge_u = np.repeat(np.arange(num_nodes, dtype=np.int32), np.diff(upper.indptr))
+    return edge_u, upper.indices.astype(np.int32), num_nodes
+
+
+def pair_rhs(num_nodes, sat1, sat2, idx_map=None):
+    """
+    Right-hand side routing one unit from sat1 to sat2: +1 at sat1, -1 at
+    sat2 (rows through idx_map when given). Entries accumulate, so a
+    same-satellite pair has b = 0 and zero flow. Every router builds its
+    right-hand sides here so all methods agree on that case.
+    """
+    b = np.zeros(num_nodes)
+    b[sat1 if idx_map is None else idx_map[sat1]] += 1
+    b[sat2 if idx_map is None else idx_map[sat2]] -= 1
+    return b
+
+
+def pair_rhs_block(num_nodes, pairs, idx_map=None):
+    """pair_rhs for every (sat1, sat2) in pairs, as the columns of an [N, P] block."""
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    if idx_map is not None:
+        pairs = np.array([[idx_map[s] for s in pair] for pair in pairs.tolist()], dtype=np.int64).reshape(-1, 2)
+    B = np.zeros((num_nodes, len(pairs)))
+    columns = np.arange(len(pairs))
+    np.add.at(B, (pairs[:, 0], columns), 1)
+    np.add.at(B, (pairs[:, 1], columns), -1)
+    return B
+
+
+def build_laplacian(edge_u, edge_v, num_nodes):
+    """
+    Assemble the graph Laplacian L = D - A in CSR from undirected edge arrays.
+    Isolated satellites get a unit diagonal so every row stays invertible for
+    the iterative solvers; they are their own component either way.
+    """
+    degree = np.bincount(edge_u, minlength=num_nodes) + np.bincount(edge_v, minlength=num_nodes)
+    diagonal = np.maximum(degree, 1).astype(float)
+    nodes = np.arange(num_nodes)
+
+    rows = np.concatenate([edge_u, edge_v, nodes])
+    cols = np.concatenate([edge_v, edge_u, nodes])
+    data = np.concatenate([-np.ones(2 * edge_u.size), diagonal])
+    return coo_matrix((data, (rows, cols)), shape=(num_nodes, num_nodes)).tocsr()
+
+
+def to_float32_csr(A):
+    """
+    Copy of a CSR matrix with float32 data and int32 indices. Laplacian
+    entries are small integers, so the copy is exact; only SpMV results
+    round to float32.
+    """
+    return csr_matrix((A.data.astype(np.float32), A.indices.astype(np.int32), A.indptr.astype(np.int32)),
+                      shape=A.shape)
+
+
+def build_weighted_adjacency(edge_u, edge_v, weights, num_nodes):
+    """Symmetric CSR adjacency with `weights` on both directions of each edge."""
+    rows = np.concatenate([edge_u, edge_v])
+    cols = np.concatenate([edge_v, edge_u])
+    data = np.concatenate([weights, weights])
+    return coo_matrix((data, (rows, cols)), shape=(num_nodes, num_nodes)).tocsr()
+
+
+def edge_latencies(satellite_positions, edge_u, edge_v):
+    lat1, lon1 = satellite_positions[edge_u, 0], satellite_positions[edge_u, 1]
+    lat2, lon2 = satellite_positions[edge_v, 0], satellite_positions[edge_v, 1]
+    return calculate_latency(lat1, lon1, lat2, lon2)
+
+
+class SatelliteTopology:
+    """
+    Array-backed constellation topology shared by every routing method.
+
+    Holds the undirected edge arrays, the CSR Laplacian used by the linear
+    solvers, connected-component labels, and (when satellite positions are
+    known) the latency-weighted adjacency used by Dijkstra. Matrix rows are
+    indexed by satellite id. Reachability queries and component labels come
+    from a ReachabilityIndex. Link outages go through remove_link() /
+    add_link(), which update it incrementally and drop the cached matrices
+    so they are re-assembled from the current edges on next use.
+    """
+
+    def __init__(self, edge_u, edge_v, num_nodes, satellite_positions=None):
+        self.edge_u = edge_u
+        self.edge_v = edge_v
+        self.num_nodes = num_nodes
+        self.satellite_positions = satellite_positions
+        with phase("matrix_assembly"):
+            self._laplacian = build_laplacian(edge_u, edge_v, num_nodes)
+            _, labels = connected_components(self._laplacian, directed=False)
+            self.reachability = ReachabilityIndex(num_nodes, edge_u, edge_v, labels=labels)
+        self.nodes = list(range(num_nodes))
+        self.idx_map = {node: node for node in self.nodes}
+        self._edge_weights = None
+        self._weighted_adjacency = None
+        self._laplacian_float32 = None
+
+    @classmethod
+    def from_arrays(cls, edge_u, edge_v, num_nodes, laplacian, labels, satellite_positions=None,
+                    edge_weights=None, weighted_adjacency=None):
+        """
+        Rebuild a topology from previously computed arrays (e.g. memory-mapped
+        from the on-disk cache) without re-assembling the Laplacian or
+        re-running connected components.
+        """
+        topology = cls.__new__(cls)
+        topology.edge_u = edge_u
+        topology.edge_v = edge_v
+        topology.num_nodes = num_nodes
+        topology.satellite_positions = satellite_positions
+        topology._laplacian = laplacian
+        topology.reachability = ReachabilityIndex(num_nodes, edge_u, edge_v, labels=labels)
+        topology.nodes = list(range(num_nodes))
+        topology.idx_map = {node: node for node in topology.nodes}
+        topology._edge_weights = edge_weights
+        topology._weighted_adjacency = weighted_adjacency
+        topology._laplacian_float32 = None
+        return topology
+
+    @property
+    def labels(self):
+        return self.reachability.labels
+
+    @property
+    def num_components(self):
+        return len(np.unique(self.labels))
+
+    @property
+    def laplacian(self):
+        if self._laplacian is None:
+            with phase("matrix_assembly"):
+                self._laplacian = build_laplacian(self.edge_u, self.edge_v, self.num_nodes)
+        return self._laplacian
+
+    def connected(self, sat1, sat2):
+        return self.reachability.connected(sat1, sat2)
+
+    def add_link(self, u, v):
+        """Restore (or add) the link u-v."""
+        u, v = min(u, v), max(u, v)
+        if np.any((self.edge_u == u) & (self.edge_v == v)):
+            return
+        self.edge_u = np.append(self.edge_u, np.int32(u))
+        self.edge_v = np.append(self.edge_v, np.int32(v))
+        self.reachability.add_link(u, v)
+        self._invalidate()
+
+    def remove_link(self, u, v):
+        """Fail the link u-v."""
+        u, v = min(u, v), max(u, v)
+        keep = (self.edge_u != u) | (self.edge_v != v)
+        if keep.all():
+            return
+        self.edge_u = self.edge_u[keep]
+        self.edge_v = self.edge_v[keep]
+        self.reachability.remove_link(u, v)
+        self._invalidate()
+
+    def _invalidate(self):
+        self._laplacian = None
+        self._laplacian_float32 = None
+        self._edge_weights = None
+        self._weighted_adjacency = None
+
+    def system_matrix(self):
+        """Same (A, idx_map, nodes) triple as build_system_matrix."""
+        return self.laplacian, self.idx_map, self.nodes
+
+    def laplacian_float32(self):
+        """The Laplacian as float32/int32 CSR, for mixed-precision solvers."""
+        if self._laplacian_float32 is None:
+            self._laplacian_float32 = to_float32_csr(self.laplacian)
+        return self._laplacian_float32
+
+    def edge_weights(self):
+        if self._edge_weights is None:
+            self._edge_weights = edge_latencies(self.satellite_positions, self.edge_u, self.edge_v)
+        return self._edge_weights
+
+    def weighted_adjacency(self):
+        if self._weighted_adjacency is None:
+            with phase("matrix_assembly"):
+                self._weighted_adjacency = build_weighted_adjacency(
+                    self.edge_u, self.edge_v, self.edge_weights(), self.num_nodes)
+        return self._weighted_adjacency
+
+
+def build_topology(satellite_positions, connectivity):
+    num_nodes = len(satellite_positions) if satellite_positions is not None else None
+    with phase("graph_build"):
+        edge_u, edge_v, num_nodes = connectivity_to_edges(connectivity, num_nodes)
+    return SatelliteTopology(edge_u, edge_v, num_nodes, satellite_positions)
+
+
+def build_system_matrix(graph):
+    """
+    Laplacian of a networkx graph in CSR, with rows in graph.nodes order.
+    Returns:
+        A: csr_matrix, idx_map: {node: row}, nodes: list
+    """
+    nodes = list(graph.nodes)
+    idx_map = {node: i for i, node in enumerate(nodes)}
+    edges = np.array([(idx_map[u], idx_map[v]) for u, v in graph.edges if u != v],
+                     dtype=np.int32).reshape(-1, 2)
+    return build_laplacian(edges[:, 0], edges[:, 1], len(nodes)), idx_map, nodes
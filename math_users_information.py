@@ -1,7 +1,9 @@
-import heapq
 import numpy as np
+from math_spatial_index import get_spatial_index, latlon_to_unit_xyz
 
 class USER:
+    __slots__ = ("user_id", "city", "latitude", "longitude", "create_time", "session_id")
+
     def __init__(self, user_id, city, latitude, longitude, create_time, session_id):
         self.user_id = user_id
         self.city = city
@@ -20,13 +22,90 @@ class USER:
         return self.latitude, self.longitude
 
 
+class UserTable:
+    """
+    Struct-of-arrays user store: one NumPy column per USER attribute.
+
+    Rows are ordered by session_id so a session is a contiguous slice.
+    City names are stored once in `city_names` and referenced by city_code.
+    """
+
+    def __init__(self, user_id, city_code, latitude, longitude, create_time, session_id, city_names):
+        self.user_id = np.asarray(user_id, dtype=np.int64)
+        self.city_code = np.asarray(city_code, dtype=np.int8)
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        self.longitude = np.asarray(longitude, dtype=np.float64)
+        self.create_time = np.asarray(create_time, dtype=np.int64)
+        self.session_id = np.asarray(session_id, dtype=np.int64)
+        self.city_names = list(city_names)
+
+    def __len__(self):
+        return self.user_id.size
+
+    def get_locations(self):
+        return self.latitude, self.longitude
+
+    def get_cities(self):
+        return np.asarray(self.city_names, dtype=object)[self.city_code]
+
+    def session_ids(self):
+        return np.unique(self.session_id)
+
+    def session_slice(self, session_id):
+        start, stop = np.searchsorted(self.session_id, [session_id, session_id + 1])
+        return self._rows(start, stop)
+
+    def session_slices(self, session_ids):
+        """session_slice() for each id, with one searchsorted pass over the column."""
+        session_ids = np.asarray(session_ids, dtype=np.int64)
+        starts = np.searchsorted(self.session_id, session_ids)
+        stops = np.searchsorted(self.session_id, session_ids + 1)
+        return [self._rows(start, stop) for start, stop in zip(starts.tolist(), stops.tolist())]
+
+    def _rows(self, start, stop):
+        """View of rows [start, stop) sharing this table's columns."""
+        view = UserTable.__new__(UserTable)
+        for column in ("user_id", "city_code", "latitude", "longitude", "create_time", "session_id"):
+            setattr(view, column, getattr(self, column)[start:stop])
+        view.city_names = self.city_names
+        return view
+
+    def to_users(self):
+        cities = self.get_cities()
+        return [USER(uid, city, lat, lon, created, sid) for uid, city, lat, lon, created, sid in zip(
+            self.user_id.tolist(), cities.tolist(), self.latitude.tolist(), self.longitude.tolist(),
+            self.create_time.tolist(), self.session_id.tolist())]
+
+
+def user_locations(users):
+    """(latitudes, longitudes) arrays for a UserTable or a list of USER."""
+    if isinstance(users, UserTable):
+        return users.get_locations()
+    locations = np.array([u.get_location() for u in users], dtype=float).reshape(-1, 2)
+    return locations[:, 0], locations[:, 1]
+
+
+def user_ids(users):
+    if isinstance(users, UserTable):
+        return users.user_id
+    return np.array([u.get_id() for u in users], dtype=np.int64)
+
+
+def user_cities(users):
+    if isinstance(users, UserTable):
+        return users.get_cities()
+    return np.array([u.get_city() for u in users], dtype=object)
+
+
 def find_user_center(user_list):
     """
-    Compute average (lat, lon) for a list of users.
+    Compute average (lat, lon) for a list of users or a UserTable.
+    Locations are averaged as unit-sphere vectors, so groups straddling the
+    antimeridian get a center between them rather than on the far side.
     """
-    latitudes = [u.latitude for u in user_list]
-    longitudes = [u.longitude for u in user_list]
-    return float(np.mean(latitudes)), float(np.mean(longitudes))
+    latitudes, longitudes = user_locations(user_list)
+    x, y, z = latlon_to_unit_xyz(latitudes, longitudes).mean(axis=0)
+    return float(np.degrees(np.arctan2(z, np.hypot(x, y)))), float(np.degrees(np.arctan2(y, x)))
 
 
 def k_center(user_list, satellite_positions, k=3):
@@ -34,7 +113,7 @@ def k_center(user_list, satellite_positions, k=3):
     Find k closest satellites to the user cluster center.
 
     Args:
-        user_list (list of USER)
+        user_list (list of USER or UserTable)
         satellite_positions (np.ndarray): shape [N, 2]
         k (int): number of satellites to return
 
@@ -42,6 +121,5 @@ def k_center(user_list, satellite_positions, k=3):
         list of satellite indices (int)
     """
     center_lat, center_lon = find_user_center(user_list)
-    distances = np.sum((satellite_positions - np.array([center_lat, center_lon])) ** 2, axis=1)
-    closest_ids = heapq.nsmallest(k, range(len(distances)), key=lambda idx: distances[idx])
-    return closest_ids
+    closest_ids, _ = get_spatial_index(satellite_positions).k_nearest([center_lat], [center_lon], k=k)
+    return np.atleast_1d(closest_ids[0]).tolist()
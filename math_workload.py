@@ -0,0 +1,354 @@
+import argparse
+import sys
+import time
+from collections.abc import Mapping
+import numpy as np
+from math_satellites import generate_synthetic_satellite_grid
+from math_topology import build_topology, pair_rhs_block
+from math_flow_results import FlowResults, FlowRoute
+from math_instrumentation import phase
+from math_network_setup import generate_user_table, assign_satellite_indices
+from math_service import BATCH_ROUTERS, BLOCK_SOLVERS, batch_router, block_solver
+from math_streaming import PAIR_SOLVERS
+from math_multigrid import infer_grid_shape, compute_satellite_routes_multigrid
+from math_jacobi import compute_satellite_routes_jacobi
+from math_gauss_seidel import compute_satellite_routes_gauss_seidel
+from math_direct import compute_satellite_routes_direct
+from math_conjugate_gradient import compute_satellite_routes_cg
+from math_greedy import compute_satellite_routes_dijkstra
+
+_UNREACHABLE_ROUTE = {"latency": float("inf"), "path": None}
+
+# Per-session router computing the same routes as run_workload(method=...)
+SESSION_ROUTERS = {
+    "jacobi": compute_satellite_routes_jacobi,
+    "gauss_seidel": compute_satellite_routes_gauss_seidel,
+    "direct": compute_satellite_routes_direct,
+    "cg": compute_satellite_routes_cg,
+    "multigrid": compute_satellite_routes_multigrid,
+    "dijkstra": compute_satellite_routes_dijkstra,
+}
+
+
+def session_pairs(starts, sizes):
+    """
+    Row indices of every within-session user pair for sessions stored as
+    contiguous row ranges [start, start + size), built with one
+    triu_indices per distinct session size.
+    Returns:
+        pair_session, row1, row2: np.ndarray shape [P], session-major and in
+            itertools.combinations order within each session
+    """
+    pair_session, row1, row2 = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for size in np.unique(sizes):
+        sessions = np.flatnonzero(sizes == size)
+        i, j = np.triu_indices(size, 1)
+        pair_session.append(np.repeat(sessions, i.size))
+        row1.append((starts[sessions, None] + i).ravel())
+        row2.append((starts[sessions, None] + j).ravel())
+    pair_session, row1, row2 = (np.concatenate(parts) for parts in (pair_session, row1, row2))
+    order = np.argsort(pair_session, kind="stable")
+    return pair_session[order], row1[order], row2[order]
+
+
+class SessionRoutes(Mapping):
+    """Read-only {(uid1, uid2): route} view of one session's slice of a WorkloadResults."""
+
+    def __init__(self, workload, start, stop):
+        self._workload = workload
+        self._start = start
+        self._stop = stop
+        self._positions = None
+
+    def _position(self, key):
+        if self._positions is None:
+            keys = zip(self._workload.uid1[self._start:self._stop].tolist(),
+                       self._workload.uid2[self._start:self._stop].tolist())
+            self._positions = {k: self._start + n for n, k in enumerate(keys)}
+        return self._positions[key]
+
+    def __getitem__(self, key):
+        return self._workload.route(self._position(key))
+
+    def __iter__(self):
+        return zip(self._workload.uid1[self._start:self._stop].tolist(),
+                   self._workload.uid2[self._start:self._stop].tolist())
+
+    def __len__(self):
+        return self._stop - self._start
+
+
+class WorkloadResults(Mapping):
+    """
+    {session_id: SessionRoutes} for a whole workload.
+
+    Pairs of all sessions are held as flat arrays in session order. Each
+    distinct satellite pair was solved once: flow methods keep one stored
+    potential per distinct ordered pair (the reverse direction is the same
+    solve, negated) and Dijkstra keeps one route per unordered pair, with
+    the path reversed on lookup. session_stats holds per-session columns:
+        num_users, num_pairs
+        distinct_pairs: distinct satellite pairs the session needs
+        new_pairs: distinct pairs first needed by this session
+        solve_s: solve time attributed to the session, each distinct pair's
+            cost split evenly over the sessions that share it
+        ready_s: seconds from the start of the run until every route of
+            the session had been solved
+        pairs_per_s: num_pairs / solve_s
+    """
+
+    def __init__(self, method, session_ids, offsets, uid1, uid2, pair_route, pair_flipped, store, routes,
+                 session_stats, timings):
+        self.method = method
+        self.session_ids = session_ids
+        self.offsets = offsets
+        self.uid1 = uid1
+        self.uid2 = uid2
+        self.pair_route = pair_route
+        self.pair_flipped = pair_flipped
+        self.store = store
+        self.routes = routes
+        self.session_stats = session_stats
+        self.timings = timings
+        self._index = {sid: n for n, sid in enumerate(session_ids.tolist())}
+
+    def route(self, position):
+        """Route of the pair at flat position (session order)."""
+        k = int(self.pair_route[position])
+        if self.store is not None:
+            return FlowRoute(self.store, k)
+        if k < 0:
+            return _UNREACHABLE_ROUTE
+        route = self.routes[k]
+        if self.pair_flipped[position]:
+            return {"latency": route["latency"], "path": route["path"][::-1]}
+        return route
+
+    def __getitem__(self, session_id):
+        n = self._index[session_id]
+        return SessionRoutes(self, int(self.offsets[n]), int(self.offsets[n + 1]))
+
+    def __iter__(self):
+        return iter(self.session_ids.tolist())
+
+    def __len__(self):
+        return self.session_ids.size
+
+    def summary(self):
+        stats = self.session_stats
+        total = sum(self.timings.values())
+        num_pairs = int(stats["num_pairs"].sum())
+        distinct = int(stats["new_pairs"].sum())
+        return {
+            "method": self.method,
+            "sessions": len(self),
+            "users": int(stats["num_users"].sum()),
+            "user_pairs": num_pairs,
+            "distinct_pairs": distinct,
+            "session_distinct_pairs": int(stats["distinct_pairs"].sum()),
+            "dedup_ratio": num_pairs / distinct if distinct else float("inf"),
+            "seconds": total,
+            "pairs_per_s": num_pairs / total if total else float("inf"),
+            "sessions_per_s": len(self) / total if total else float("inf"),
+            "timings": dict(self.timings),
+            "ready_s": {f"p{p}": float(v) for p, v in
+                        zip((50, 90, 99), np.percentile(stats["ready_s"], (50, 90, 99)))} if len(self) else {},
+        }
+
+    def report(self):
+        s = self.summary()
+        lines = [
+            f"{s['method']}: {s['sessions']} sessions, {s['users']} users, {s['user_pairs']} user pairs",
+            f"  {s['distinct_pairs']} distinct satellite pairs solved "
+            f"({s['session_distinct_pairs']} if solved per session, {s['dedup_ratio']:.1f} user pairs per solve)",
+            f"  {s['seconds']:.3f} s total, {s['pairs_per_s']:.0f} pairs/s, {s['sessions_per_s']:.0f} sessions/s",
+            "  " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in s["timings"].items()),
+        ]
+        if s["ready_s"]:
+            lines.append("  session ready time: " + ", ".join(f"{p} {v * 1e3:.1f}ms" for p, v in s["ready_s"].items()))
+            rate = self.session_stats["pairs_per_s"]
+            rate = rate[np.isfinite(rate)]
+            if rate.size:
+                lines.append(f"  per-session pairs/s: median {np.median(rate):.0f}, min {rate.min():.0f}")
+        return "\n".join(lines)
+
+
+@phase("solve")
+def run_workload(table, satellite_positions, connectivity, method="direct", topology=None, chunk_size=512,
+                 flow_dtype=np.float64, flow_threshold=None, **solver_options):
+    """
+    Route every within-session user pair of every session in a UserTable.
+
+    All users are assigned to satellites in one vectorized query, and the
+    user pairs of all sessions are reduced to the union of distinct
+    satellite pairs. Those are solved once each, in blocks of chunk_size
+    right-hand sides ordered by the first session that needs them, so early
+    sessions become ready first. Results fan back out per session through
+    lazy views. Same-satellite pairs get a zero potential (or a zero-latency
+    one-hop path) and pairs in different components are unreachable.
+    Returns:
+        WorkloadResults
+    """
+    timings = {}
+    start = time.perf_counter()
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    num_nodes = topology.num_nodes
+    timings["setup"] = time.perf_counter() - start
+
+    clock = time.perf_counter()
+    sats = np.asarray(assign_satellite_indices(table, satellite_positions), dtype=np.int64)
+    session_ids, starts, sizes = np.unique(table.session_id, return_index=True, return_counts=True)
+    num_sessions = session_ids.size
+    timings["assignment"] = time.perf_counter() - clock
+
+    clock = time.perf_counter()
+    pair_session, row1, row2 = session_pairs(starts, sizes)
+    offsets = np.zeros(num_sessions + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_session, minlength=num_sessions), out=offsets[1:])
+    sat1, sat2 = sats[row1], sats[row2]
+    reachable = np.flatnonzero(topology.labels[sat1] == topology.labels[sat2])
+
+    # Distinct unordered pairs, numbered in order of the first session that needs them
+    lo = np.minimum(sat1[reachable], sat2[reachable])
+    hi = np.maximum(sat1[reachable], sat2[reachable])
+    keys, first, canon = np.unique(lo * num_nodes + hi, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    keys, canon = keys[order], rank[canon.reshape(-1)]
+    pairs = np.column_stack(np.divmod(keys, num_nodes))
+    flipped = sat1[reachable] > sat2[reachable]
+    timings["dedup"] = time.perf_counter() - clock
+
+    clock = time.perf_counter()
+    num_chunks = -(-len(pairs) // chunk_size)
+    chunk_done = np.zeros(num_chunks)
+    chunk_cost = np.zeros(len(pairs))
+    pair_route = np.full(row1.size, -1, dtype=np.int64)
+    store, routes = None, None
+
+    if method in BATCH_ROUTERS:
+        route_batch = batch_router(topology, method, **solver_options)
+        routes = []
+        for c in range(num_chunks):
+            chunk_start = time.perf_counter()
+            chunk = pairs[c * chunk_size:(c + 1) * chunk_size]
+            routes.extend(route_batch([tuple(pair) for pair in chunk.tolist()]))
+            chunk_cost[c * chunk_size:(c + 1) * chunk_size] = (time.perf_counter() - chunk_start) / len(chunk)
+            chunk_done[c] = time.perf_counter() - start
+        pair_route[reachable] = canon
+    else:
+        # One stored potential per distinct ordered pair; the reverse direction is the negated solve
+        _, idx_map, nodes = topology.system_matrix()
+        solve_block = block_solver(topology, method, **solver_options)
+        directed, directed_of_pair = np.unique(canon * 2 + flipped, return_inverse=True)
+        directed_canon, directed_sign = directed // 2, np.where(directed % 2, -1.0, 1.0)
+        bounds = np.searchsorted(directed_canon, np.arange(0, num_chunks + 1) * chunk_size)
+        store = FlowResults(nodes, idx_map, len(directed), dtype=flow_dtype, threshold=flow_threshold)
+        directed_slot = np.zeros(len(directed), dtype=np.int64)
+        for c in range(num_chunks):
+            chunk_start = time.perf_counter()
+            chunk = pairs[c * chunk_size:(c + 1) * chunk_size]
+            X = solve_block(pair_rhs_block(len(nodes), chunk, idx_map))
+            members = np.arange(bounds[c], bounds[c + 1])
+            directed_slot[members] = store.store_block(
+                X[:, directed_canon[members] - c * chunk_size] * directed_sign[members])
+            chunk_cost[c * chunk_size:(c + 1) * chunk_size] = (time.perf_counter() - chunk_start) / len(chunk)
+            chunk_done[c] = time.perf_counter() - start
+        pair_route[reachable] = directed_slot[directed_of_pair.reshape(-1)]
+    timings["solve"] = time.perf_counter() - clock
+
+    # Per-session accounting over distinct (session, pair) combinations
+    clock = time.perf_counter()
+    session_of_pair = pair_session[reachable]
+    used = np.unique(session_of_pair * max(len(pairs), 1) + canon)
+    used_session, used_pair = np.divmod(used, max(len(pairs), 1))
+    sharing = np.bincount(used_pair, minlength=len(pairs))
+    solve_s = np.bincount(used_session, weights=chunk_cost[used_pair] / sharing[used_pair], minlength=num_sessions)
+    last_pair = np.full(num_sessions, -1, dtype=np.int64)
+    np.maximum.at(last_pair, used_session, used_pair)
+    ready_s = np.where(last_pair >= 0, chunk_done[np.maximum(last_pair, 0) // chunk_size] if num_chunks else 0.0,
+                       timings["setup"] + timings["assignment"] + timings["dedup"])
+    num_pairs = np.diff(offsets)
+    session_stats = {
+        "session_id": session_ids,
+        "num_users": sizes,
+        "num_pairs": num_pairs,
+        "distinct_pairs": np.bincount(used_session, minlength=num_sessions),
+        "new_pairs": np.bincount(session_of_pair[first[order]], minlength=num_sessions),
+        "solve_s": solve_s,
+        "ready_s": ready_s,
+        "pairs_per_s": np.divide(num_pairs, solve_s, out=np.full(num_sessions, np.inf), where=solve_s > 0),
+    }
+    timings["fan_out"] = time.perf_counter() - clock
+
+    return WorkloadResults(method, session_ids, offsets, table.user_id[row1], table.user_id[row2], pair_route,
+                           sat1 > sat2, store, routes, session_stats, timings)
+
+
+def compare_with_session_routers(results, table, satellite_positions, connectivity, topology=None,
+                                 max_sessions=20):
+    """
+    Route the first max_sessions sessions again with the per-session router
+    for results.method and compare. Returns the largest absolute difference
+    in total_flow or latency (flows also compare every potential entry).
+    Iterative methods stop on a step test, so they agree to within their tol
+    rather than exactly.
+    """
+    router = SESSION_ROUTERS[results.method]
+    if topology is None:
+        topology = build_topology(satellite_positions, connectivity)
+    worst = 0.0
+    for session_id in list(results)[:max_sessions]:
+        users = table.session_slice(session_id).to_users()
+        sats = assign_satellite_indices(users, satellite_positions)
+        user_to_satellite = dict(zip([u.get_id() for u in users], sats.tolist()))
+        expected = router(users, user_to_satellite, satellite_positions, connectivity, topology=topology)
+        got = results[session_id]
+        if list(expected) != list(got):
+            raise ValueError(f"session {session_id}: pair keys differ")
+        for key, route in expected.items():
+            metric = "latency" if "latency" in route else "total_flow"
+            a, b = route[metric], got[key][metric]
+            if np.isinf(a) or np.isinf(b):
+                if a != b:
+                    return float("inf")
+                continue
+            worst = max(worst, abs(a - b))
+            if metric == "total_flow":
+                worst = max(worst, float(np.abs(route["flow"].to_array() - got[key]["flow"].to_array()).max()))
+    return worst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Route many sessions at once, solving each satellite pair once.")
+    parser.add_argument("--satellites", type=int, default=400)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=8, help="users per session")
+    parser.add_argument("--method", default="direct", choices=sorted(set(BATCH_ROUTERS) | set(BLOCK_SOLVERS) | set(PAIR_SOLVERS)))
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", type=float, metavar="ATOL",
+                        help="compare the first sessions against the per-session router; fail above ATOL")
+    args = parser.parse_args(argv)
+
+    satellite_positions, connectivity = generate_synthetic_satellite_grid(args.satellites)
+    table = generate_user_table(args.sessions, args.users, seed=args.seed)
+    solver_options = {}
+    if args.method == "multigrid":
+        solver_options["grid_shape"] = infer_grid_shape(satellite_positions, connectivity)
+    results = run_workload(table, satellite_positions, connectivity, method=args.method,
+                           chunk_size=args.chunk_size, **solver_options)
+    print(results.report())
+
+    if args.check is not None:
+        difference = compare_with_session_routers(results, table, satellite_positions, connectivity)
+        print(f"max difference vs per-session {args.method} router: {difference:.3g}")
+        if not difference <= args.check:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())